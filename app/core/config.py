@@ -1,4 +1,6 @@
 """Configuration settings for the MoE Ollama endpoint."""
+from functools import cached_property, lru_cache
+from typing import List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,6 +12,12 @@ class Settings(BaseSettings):
     # Ollama Configuration
     ollama_base_url: str = "https://api.ollama.cloud"
     ollama_api_key: str = ""
+    ollama_http2: bool = True  # Multiplex concurrent requests over one connection
+    ollama_max_connections: int = 200
+    ollama_max_keepalive_connections: int = 100
+    ollama_keepalive_expiry: float = 60.0  # Seconds an idle connection is kept open
+    ollama_transport_retries: int = 2  # Retries for transient connect failures
+    ollama_models_cache_ttl: float = 30.0  # Seconds the Ollama model list is cached (0 disables)
     
     # PostgreSQL Configuration
     postgres_host: str = "localhost"
@@ -17,11 +25,20 @@ class Settings(BaseSettings):
     postgres_user: str = "moe_user"
     postgres_password: str = "moe_password"
     postgres_db: str = "moe_rag"
+    db_pool_size: int = 20  # Persistent connections kept in the pool
+    db_max_overflow: int = 40  # Extra connections allowed under burst load
+    db_pool_timeout: float = 10.0  # Seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # Recycle connections older than this (seconds)
+    db_statement_cache_size: int = 1024  # asyncpg prepared statement cache per connection
     
     # Application Configuration
     app_host: str = "0.0.0.0"
     app_port: int = 8000
     log_level: str = "INFO"
+    cors_origins: List[str] = ["http://localhost:3000"]  # Allowed browser origins (JSON list)
+    cors_allow_methods: List[str] = ["GET", "POST"]  # Methods allowed in CORS requests
+    # Request headers allowed in CORS requests; browser OpenAI SDKs send x-stainless-* and OpenAI-*
+    cors_allow_headers: List[str] = ["*"]
     
     # MoE Configuration - Ollama Cloud Models (Nov 4, 2025)
     # Text Models
@@ -39,11 +56,30 @@ class Settings(BaseSettings):
     
     # Legacy/Compatibility
     default_model: str = "gpt-oss:20b-cloud"  # Default fallback for generic queries
+    # Routing decisions memoized per (last user message digest, has images); 0 disables
+    route_cache_size: int = 8192
     
     # RAG Configuration
     embedding_model: str = "nomic-embed-text"
     vector_dimension: int = 768
+    embedding_batch_size: int = 256  # Max inputs per /api/embed request
+    embedding_max_concurrency: int = 16  # Max embedding requests in flight at once
+    embedding_cache_size: int = 10000  # Max cached embeddings (content-hash keyed)
+    embedding_cache_ttl: int = 3600  # Seconds a cached embedding stays valid
     top_k_results: int = 5
+    rag_ingest_batch_size: int = 64  # Documents embedded and committed per ingest pipeline step
+    rag_ingest_job_ttl: int = 3600  # Seconds a finished ingest job stays queryable
+    rag_prompt_cache_ttl: float = 0.0  # Per-process augmented prompt reuse, seconds (0 = off)
+    hnsw_m: int = 16  # Max graph connections per node in the HNSW index
+    hnsw_ef_construction: int = 64  # Candidate list size while building the index
+    hnsw_ef_search: int = 40  # Candidate list size per query (recall/latency tradeoff)
+    # Keep scanning when filters drop rows (pgvector >= 0.8)
+    hnsw_iterative_scan: str = "relaxed_order"
+    rag_binary_quantization: bool = False  # Hamming prefilter over sign bits, then exact rerank
+    rag_rerank_factor: int = 10  # Candidates fetched per result when binary quantization is on
+    # Max wait to coalesce searches while a batch is in flight (0 disables)
+    rag_batch_window_ms: float = 5.0
+    rag_batch_max_size: int = 64  # Flush a search batch early once this many are queued
     
     # DSPy Configuration
     dspy_cache_dir: str = ".dspy_cache"
@@ -53,6 +89,8 @@ class Settings(BaseSettings):
     max_latency_ms: int = 2000  # >2s triggers fallback
     max_retries: int = 3  # Maximum retry attempts
     circuit_breaker_threshold: int = 3  # Failures before quarantine
+    circuit_breaker_cooldown: float = 30.0  # Seconds in quarantine before a single probe request
+    circuit_breaker_max_cooldown: float = 300.0  # Cap on cooldown growth after failed probes
     retry_backoff_factor: float = 2.0  # Exponential backoff multiplier
     retry_initial_delay: float = 0.1  # Initial retry delay in seconds
     
@@ -66,15 +104,21 @@ class Settings(BaseSettings):
         "don't know", "can't say", "unsure", "might be", "could be"
     ]  # Trigger phrases for low confidence detection
     
-    @property
+    @cached_property
     def database_url(self) -> str:
         """Construct PostgreSQL database URL."""
         return f"postgresql://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
     
-    @property
+    @cached_property
     def async_database_url(self) -> str:
         """Construct async PostgreSQL database URL."""
         return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the process-wide settings instance, parsed from env/.env once."""
+    return Settings()
+
+
+settings = get_settings()
@@ -0,0 +1,45 @@
+"""Non-blocking structured logging setup."""
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+
+
+class JSONFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        """Serialize a log record to a JSON line."""
+        # QueueHandler has already merged any traceback into the message
+        return orjson.dumps({
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }).decode()
+
+
+def setup_logging(level: str) -> QueueListener:
+    """
+    Route root logging through a queue so formatting and I/O happen off the event loop.
+    
+    Args:
+        level: Root log level name
+    
+    Returns:
+        The started listener; it is stopped at interpreter exit to flush pending records
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JSONFormatter())
+    
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(log_queue)]
+    root.setLevel(level)
+    
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
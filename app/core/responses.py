@@ -0,0 +1,12 @@
+"""Response classes shared by the API routes."""
+from typing import Any
+import orjson
+from starlette.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, for payloads built as plain dicts."""
+    
+    def render(self, content: Any) -> bytes:
+        """Serialize content to JSON bytes."""
+        return orjson.dumps(content)
@@ -1,9 +1,15 @@
 """Database initialization and session management."""
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from contextlib import asynccontextmanager
 from app.core.config import settings
 from app.db.models import Base
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Set by init_db once the installed pgvector version is known to support iterative scans
+_iterative_scan_supported = False
 
 
 # Async engine for database operations
@@ -11,23 +17,88 @@ async_engine = create_async_engine(
     settings.async_database_url,
     echo=settings.log_level == "DEBUG",
     future=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=True,
+    connect_args={
+        "statement_cache_size": settings.db_statement_cache_size,
+        # Per-connection HNSW search tuning
+        "server_settings": {
+            "hnsw.ef_search": str(settings.hnsw_ef_search),
+        },
+    },
 )
 
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _set_iterative_scan(dbapi_connection, connection_record):
+    """
+    Enable HNSW iterative scans on each new connection when pgvector supports them.
+    
+    Iterative scans let collection-filtered queries still return top_k rows through
+    the index instead of a short result. The setting only exists in pgvector >= 0.8.
+    """
+    if _iterative_scan_supported:
+        dbapi_connection.run_async(
+            lambda conn: conn.execute(
+                "SELECT set_config('hnsw.iterative_scan', $1, false)",
+                settings.hnsw_iterative_scan,
+            )
+        )
+
 # Async session factory
-async_session_factory = sessionmaker(
+async_session_factory = async_sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
 )
 
 
+def _parse_version(version: str) -> tuple:
+    """Parse an extension version such as '0.8.0' into a comparable tuple."""
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
 async def init_db():
     """Initialize database tables and extensions."""
+    global _iterative_scan_supported
     from sqlalchemy import text
     
     async with async_engine.begin() as conn:
         # Enable pgvector extension
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        version = await conn.scalar(
+            text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        )
+        _iterative_scan_supported = _parse_version(version) >= (0, 8)
+        if _iterative_scan_supported:
+            # Connections opened from now on set it in the connect hook; this one predates it
+            await conn.execute(
+                text("SELECT set_config('hnsw.iterative_scan', :mode, false)"),
+                {"mode": settings.hnsw_iterative_scan},
+            )
+        else:
+            logger.warning(
+                f"pgvector {version} does not support iterative scans; "
+                "filtered searches may return fewer than top_k rows (needs >= 0.8)"
+            )
         # Create all tables
         await conn.run_sync(Base.metadata.create_all)
+        # ANN index so similarity search avoids a sequential scan. Embeddings are stored
+        # L2-normalized halfvecs, so inner product ordering is equivalent to cosine distance.
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS documents_embedding_hnsw_halfvec_ip_idx ON documents "
+            "USING hnsw (embedding halfvec_ip_ops) "
+            f"WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction})"
+        ))
+        if settings.rag_binary_quantization:
+            # Sign-bit index for the Hamming prefilter (pgvector >= 0.7)
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS documents_embedding_bq_hnsw_idx ON documents "
+                f"USING hnsw ((binary_quantize(embedding)::bit({settings.vector_dimension})) "
+                "bit_hamming_ops) "
+                f"WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction})"
+            ))
 
 
 @asynccontextmanager
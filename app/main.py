@@ -2,17 +2,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 from app.core.config import settings
+from app.core.logging_config import setup_logging
+from app.core.responses import ORJSONResponse
 from app.routes import chat, models, embeddings, rag
 from app.db.database import init_db
 from app.services.ollama_client import ollama_service
 
 # Configure logging
-logging.basicConfig(
-    level=settings.log_level,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+setup_logging(settings.log_level)
 logger = logging.getLogger(__name__)
 
 
@@ -29,6 +29,12 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Database initialization failed: {e}. RAG features may not work.")
     
+    # Establish the Ollama connection (TCP + TLS) before serving traffic
+    await ollama_service.warmup()
+    
+    # Load the token encoding off the event loop; it may download its BPE file
+    await asyncio.to_thread(chat.load_token_encoding)
+    
     yield
     
     # Shutdown
@@ -42,15 +48,18 @@ app = FastAPI(
     description="Production-grade OpenAI-compatible endpoint orchestrating Ollama Cloud models as a MoE system with RAG, vision, and tool support",
     version="0.1.0",
     lifespan=lifespan,
+    # Every route renders with orjson, not only those returning ORJSONResponse directly
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=settings.cors_origins,
+    # Credentials are invalid with a wildcard origin, so only allow them for an explicit allowlist
+    allow_credentials="*" not in settings.cors_origins,
+    allow_methods=settings.cors_allow_methods,
+    allow_headers=settings.cors_allow_headers,
 )
 
 # Include routers
@@ -86,7 +95,7 @@ if __name__ == "__main__":
     import uvicorn
     
     uvicorn.run(
-        "main:app",
+        "app.main:app",
         host=settings.app_host,
         port=settings.app_port,
         reload=True,
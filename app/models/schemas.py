@@ -122,3 +122,12 @@ class RAGIngestResponse(BaseModel):
     success: bool
     documents_ingested: int
     message: str
+
+
+class RAGIngestJob(BaseModel):
+    """Status of a background RAG ingestion job."""
+    job_id: str
+    status: Literal["pending", "running", "completed", "failed"]
+    documents_total: int
+    documents_ingested: int = 0
+    message: Optional[str] = None
@@ -1,28 +1,118 @@
 """Chat completion routes."""
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-from app.models.schemas import ChatCompletionRequest, ChatCompletionResponse, ChatCompletionChoice, Usage, Message
+from app.core.responses import ORJSONResponse
+from app.models.schemas import ChatCompletionRequest, ChatCompletionResponse
 from app.services.ollama_client import ollama_service
 from app.services.router import moe_router
 from app.services.rag import rag_service
+import secrets
 import time
-import json
+import orjson
 import logging
-from typing import AsyncIterator
+import tiktoken
+from functools import lru_cache
+from typing import AsyncIterator, Any, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.post("/chat/completions", response_model=ChatCompletionResponse)
+def _completion_id() -> str:
+    """Random completion id, unique across workers and replicas."""
+    return f"chatcmpl-{secrets.token_hex(12)}"
+
+
+@lru_cache(maxsize=1)
+def load_token_encoding() -> Optional[tiktoken.Encoding]:
+    """
+    Load the BPE encoding once; None if it cannot be loaded (e.g. offline).
+    
+    The first load may download the BPE file with a blocking HTTP request, so
+    call it from a worker thread at startup rather than on the event loop.
+    """
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable, using character estimate: {e}")
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    """Count tokens in text, estimating 4 characters per token without an encoding."""
+    encoding = load_token_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode_ordinary(text))
+
+
+def _count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Count prompt tokens over the text content of messages."""
+    total = 0
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            total += _count_tokens(content)
+        elif isinstance(content, list):
+            # Multi-modal content - count text parts only
+            for item in content:
+                if isinstance(item, dict) and item.get("type") == "text":
+                    total += _count_tokens(item.get("text", ""))
+    return total
+
+
+def _extract_text(content: Any) -> str:
+    """Extract the text of a message content, joining text parts of multi-modal content."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(
+            item.get("text", "")
+            for item in content
+            if isinstance(item, dict) and item.get("type") == "text"
+        )
+    return ""
+
+
+def _replace_text(message: Dict[str, Any], text: str) -> None:
+    """Replace a message's text in place, preserving non-text parts of multi-modal content."""
+    content = message.get("content")
+    if not isinstance(content, list):
+        message["content"] = text
+        return
+    
+    # Collapse all text parts into one at the position of the first, keep the rest as-is
+    new_content = []
+    replaced = False
+    for item in content:
+        if isinstance(item, dict) and item.get("type") == "text":
+            if not replaced:
+                new_content.append({**item, "text": text})
+                replaced = True
+        else:
+            new_content.append(item)
+    if not replaced:
+        # No text part to replace (e.g. image-only content): add one in front
+        new_content.insert(0, {"type": "text", "text": text})
+    message["content"] = new_content
+
+
+@router.post(
+    "/chat/completions",
+    response_model=None,
+    responses={200: {"model": ChatCompletionResponse}},
+)
 async def create_chat_completion(request: ChatCompletionRequest):
     """
     Create a chat completion (OpenAI-compatible).
     """
     try:
+        # Prepare messages once; reused for routing and the completion call
+        messages = [msg.model_dump(exclude_none=True) for msg in request.messages]
+        
         # Route to appropriate model
         model, use_rag = await moe_router.route_request(
-            messages=[msg.model_dump() for msg in request.messages],
+            messages=messages,
             use_rag=request.use_rag or False,
         )
         
@@ -30,19 +120,16 @@ async def create_chat_completion(request: ChatCompletionRequest):
         if request.model and request.model != "auto":
             model = request.model
         
-        # Prepare messages
-        messages = [msg.model_dump() for msg in request.messages]
-        
         # Apply RAG if enabled
         if use_rag or request.use_rag:
-            # Get last user message
+            # Locate last user message with a single backward index walk
+            last_user_idx = next(
+                (i for i in range(len(messages) - 1, -1, -1) if messages[i].get("role") == "user"),
+                None,
+            )
             last_user_msg = None
-            for msg in reversed(messages):
-                if msg.get("role") == "user":
-                    content = msg.get("content", "")
-                    if isinstance(content, str):
-                        last_user_msg = content
-                    break
+            if last_user_idx is not None:
+                last_user_msg = _extract_text(messages[last_user_idx].get("content"))
             
             if last_user_msg:
                 # Augment with RAG context
@@ -51,11 +138,8 @@ async def create_chat_completion(request: ChatCompletionRequest):
                     collection=request.rag_collections[0] if request.rag_collections else None,
                 )
                 
-                # Replace last user message with augmented version
-                for msg in reversed(messages):
-                    if msg.get("role") == "user":
-                        msg["content"] = augmented_prompt
-                        break
+                # Replace last user message text with augmented version, keeping image parts
+                _replace_text(messages[last_user_idx], augmented_prompt)
         
         # Handle streaming
         if request.stream:
@@ -77,33 +161,35 @@ async def create_chat_completion(request: ChatCompletionRequest):
         assistant_message = response.get("message", {})
         content = assistant_message.get("content", "")
         
-        # Calculate token usage (approximate)
-        prompt_tokens = sum(len(str(msg.get("content", ""))) // 4 for msg in messages)
-        completion_tokens = len(content) // 4
+        # Calculate token usage
+        prompt_tokens = _count_message_tokens(messages)
+        completion_tokens = _count_tokens(content)
         
-        # Format response
-        completion_response = ChatCompletionResponse(
-            id=f"chatcmpl-{int(time.time())}",
-            created=int(time.time()),
-            model=model,
-            choices=[
-                ChatCompletionChoice(
-                    index=0,
-                    message=Message(
-                        role="assistant",
-                        content=content,
-                    ),
-                    finish_reason="stop",
-                )
+        # Format response; built as a plain dict to skip response-model re-validation
+        created = int(time.time())
+        completion_response = {
+            "id": _completion_id(),
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": content,
+                    },
+                    "finish_reason": "stop",
+                }
             ],
-            usage=Usage(
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens,
-                total_tokens=prompt_tokens + completion_tokens,
-            ),
-        )
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
         
-        return completion_response
+        return ORJSONResponse(content=completion_response)
     
     except Exception as e:
         logger.error(f"Error in chat completion: {e}")
@@ -118,58 +204,56 @@ async def stream_chat_completion(
     request: ChatCompletionRequest,
     model: str,
     messages: list,
-) -> AsyncIterator[str]:
+) -> AsyncIterator[bytes]:
     """Stream chat completion responses."""
+    # Build the chunk skeleton once; only the delta content changes per token
+    created = int(time.time())
+    completion_id = _completion_id()
+    delta = {"content": ""}
+    chunk_data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": None,
+            }
+        ],
+    }
+    final_chunk = b"data: " + orjson.dumps({
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": {},
+                "finish_reason": "stop",
+            }
+        ],
+    }) + b"\n\n"
+    
     try:
         async for chunk in ollama_service.generate_completion_stream(
             model=model,
             messages=messages,
             temperature=request.temperature or 0.7,
         ):
-            if chunk:
-                try:
-                    data = json.loads(chunk)
-                    message = data.get("message", {})
-                    content = message.get("content", "")
-                    
-                    # Format as SSE
-                    sse_data = {
-                        "id": f"chatcmpl-{int(time.time())}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": model,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {"content": content},
-                                "finish_reason": None,
-                            }
-                        ],
-                    }
-                    
-                    yield f"data: {json.dumps(sse_data)}\n\n"
-                    
-                    if data.get("done", False):
-                        # Send final chunk
-                        final_data = {
-                            "id": f"chatcmpl-{int(time.time())}",
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": model,
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {},
-                                    "finish_reason": "stop",
-                                }
-                            ],
-                        }
-                        yield f"data: {json.dumps(final_data)}\n\n"
-                        yield "data: [DONE]\n\n"
-                except json.JSONDecodeError:
-                    continue
+            delta["content"] = chunk.get("message", {}).get("content", "")
+            
+            # Format as SSE
+            yield b"data: " + orjson.dumps(chunk_data) + b"\n\n"
+            
+            if chunk.get("done", False):
+                # Send final chunk
+                yield final_chunk
+                yield b"data: [DONE]\n\n"
     except Exception as e:
         logger.error(f"Error in streaming: {e}")
         # Don't expose internal error details
         error_data = {"error": "An error occurred while streaming the response"}
-        yield f"data: {json.dumps(error_data)}\n\n"
+        yield b"data: " + orjson.dumps(error_data) + b"\n\n"
@@ -1,6 +1,7 @@
 """Embeddings routes."""
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import EmbeddingRequest, EmbeddingResponse, EmbeddingData, Usage
+from app.core.responses import ORJSONResponse
+from app.models.schemas import EmbeddingRequest, EmbeddingResponse
 from app.services.ollama_client import ollama_service
 from app.core.config import settings
 import logging
@@ -9,7 +10,11 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.post("/embeddings", response_model=EmbeddingResponse)
+@router.post(
+    "/embeddings",
+    response_model=None,
+    responses={200: {"model": EmbeddingResponse}},
+)
 async def create_embeddings(request: EmbeddingRequest):
     """
     Create embeddings (OpenAI-compatible).
@@ -25,27 +30,24 @@ async def create_embeddings(request: EmbeddingRequest):
         embeddings = await ollama_service.generate_embeddings(model=model, text=texts)
         
         # Format response
-        embedding_data = []
-        for i, embedding in enumerate(embeddings):
-            embedding_data.append(
-                EmbeddingData(
-                    embedding=embedding,
-                    index=i,
-                )
-            )
+        embedding_data = [
+            {"object": "embedding", "embedding": embedding, "index": i}
+            for i, embedding in enumerate(embeddings)
+        ]
         
         # Calculate approximate token usage
         total_tokens = sum(len(text) // 4 for text in texts)
         
-        return EmbeddingResponse(
-            data=embedding_data,
-            model=model,
-            usage=Usage(
-                prompt_tokens=total_tokens,
-                completion_tokens=0,
-                total_tokens=total_tokens,
-            ),
-        )
+        return ORJSONResponse(content={
+            "object": "list",
+            "data": embedding_data,
+            "model": model,
+            "usage": {
+                "prompt_tokens": total_tokens,
+                "completion_tokens": 0,
+                "total_tokens": total_tokens,
+            },
+        })
     
     except Exception as e:
         logger.error(f"Error creating embeddings: {e}")
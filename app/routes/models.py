@@ -25,14 +25,15 @@ async def list_models():
         # Format models
         models = []
         seen = set()
+        created = int(time.time())
         
-        # Add MoE-configured models first
+        # Add MoE-configured models first (skipping the backup_strategy mapping)
         for name, model_id in moe_config.items():
-            if model_id not in seen:
+            if isinstance(model_id, str) and model_id not in seen:
                 models.append(
                     ModelInfo(
                         id=model_id,
-                        created=int(time.time()),
+                        created=created,
                         owned_by="ollama-moe",
                     )
                 )
@@ -45,7 +46,7 @@ async def list_models():
                 models.append(
                     ModelInfo(
                         id=model_id,
-                        created=int(time.time()),
+                        created=created,
                         owned_by="ollama",
                     )
                 )
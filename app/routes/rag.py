@@ -1,20 +1,69 @@
 """RAG-specific routes for document ingestion and management."""
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import RAGIngestRequest, RAGIngestResponse
+from typing import Any, Dict, List, Union
+import uuid
+from cachetools import TTLCache
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Response
+from app.core.config import settings
+from app.models.schemas import RAGIngestRequest, RAGIngestResponse, RAGIngestJob
 from app.services.rag import rag_service
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Background ingest jobs by id; statuses are per-process. Running jobs are kept until
+# they finish, then stay queryable for the TTL counted from completion.
+_active_jobs: Dict[str, RAGIngestJob] = {}
+_finished_jobs: TTLCache = TTLCache(maxsize=1024, ttl=settings.rag_ingest_job_ttl)
 
-@router.post("/rag/ingest", response_model=RAGIngestResponse)
-async def ingest_documents(request: RAGIngestRequest):
+
+async def _run_ingest_job(job: RAGIngestJob, documents: List[Dict[str, Any]]) -> None:
+    """Ingest documents in the background, recording the outcome on the job."""
+    job.status = "running"
+    
+    def record_progress(count: int) -> None:
+        # Committed batches stay committed even if a later one fails
+        job.documents_ingested = count
+    
+    try:
+        job.documents_ingested = await rag_service.ingest_documents(documents, on_batch=record_progress)
+        job.status = "completed"
+        job.message = f"Successfully ingested {job.documents_ingested} documents"
+    except Exception as e:
+        logger.error(f"Error in ingest job {job.job_id}: {e}")
+        job.status = "failed"
+        job.message = (
+            f"An error occurred after {job.documents_ingested} of {job.documents_total} "
+            "documents were ingested. Please try again later."
+        )
+    finally:
+        _active_jobs.pop(job.job_id, None)
+        _finished_jobs[job.job_id] = job
+
+
+@router.post("/rag/ingest", response_model=Union[RAGIngestJob, RAGIngestResponse], status_code=202)
+async def ingest_documents(
+    request: RAGIngestRequest,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    wait: bool = False,
+):
     """
     Ingest documents into the RAG system.
+    
+    By default ingestion runs in the background and a job is returned (202) that
+    can be polled at /rag/jobs/{job_id}; pass wait=true to ingest inline.
     """
+    documents = [doc.model_dump(exclude_none=True) for doc in request.documents]
+    
+    if not wait:
+        job = RAGIngestJob(job_id=uuid.uuid4().hex, status="pending", documents_total=len(documents))
+        _active_jobs[job.job_id] = job
+        background_tasks.add_task(_run_ingest_job, job, documents)
+        return job
+    
+    response.status_code = 200
     try:
-        documents = [doc.model_dump() for doc in request.documents]
         count = await rag_service.ingest_documents(documents)
         
         return RAGIngestResponse(
@@ -31,6 +80,17 @@ async def ingest_documents(request: RAGIngestRequest):
         )
 
 
+@router.get("/rag/jobs/{job_id}", response_model=RAGIngestJob)
+async def get_ingest_job(job_id: str):
+    """
+    Get the status of a background ingestion job.
+    """
+    job = _active_jobs.get(job_id) or _finished_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+
 @router.get("/rag/search")
 async def search_documents(query: str, collection: str = None, top_k: int = 5):
     """
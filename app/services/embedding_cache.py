@@ -0,0 +1,137 @@
+"""In-process cache for text embeddings."""
+import asyncio
+from hashlib import blake2b
+from typing import Dict, List
+import numpy as np
+from cachetools import TTLCache
+from app.core.config import settings
+from app.services.ollama_client import ollama_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """LRU+TTL cache of embeddings keyed by content hash, with single-flight computation."""
+    
+    def __init__(self):
+        """Initialize the embedding cache."""
+        # Stored as float32 arrays: ~4x smaller than lists of Python floats
+        self._cache: TTLCache = TTLCache(
+            maxsize=settings.embedding_cache_size,
+            ttl=settings.embedding_cache_ttl,
+        )
+        # Embeddings currently being computed, so concurrent misses share one request
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+    
+    @staticmethod
+    def _key(model: str, text: str) -> bytes:
+        """Hash model and text into a compact cache key."""
+        return blake2b(f"{model}\0{text}".encode(), digest_size=16).digest()
+    
+    async def get_or_compute(self, text: str, model: str) -> List[float]:
+        """
+        Get the embedding for a single text, computing it on a miss.
+        
+        Args:
+            text: Text to embed
+            model: Embedding model name
+        
+        Returns:
+            The embedding (empty if the model returned none)
+        """
+        embeddings = await self.get_or_compute_many([text], model)
+        return embeddings[0]
+    
+    async def get_or_compute_many(self, texts: List[str], model: str) -> List[List[float]]:
+        """
+        Get embeddings for several texts, computing all misses in one batched call.
+        
+        Args:
+            texts: Texts to embed
+            model: Embedding model name
+        
+        Returns:
+            One embedding per text, in order (empty if the model returned none)
+        """
+        results: List[List[float]] = [[] for _ in texts]
+        waiting: Dict[int, asyncio.Future] = {}
+        misses: Dict[bytes, List[int]] = {}
+        
+        for i, text in enumerate(texts):
+            key = self._key(model, text)
+            cached = self._cache.get(key)
+            if cached is not None:
+                results[i] = cached.tolist()
+            elif key in self._inflight:
+                waiting[i] = self._inflight[key]
+            else:
+                misses.setdefault(key, []).append(i)
+        
+        if misses:
+            await self._compute(texts, model, misses, results)
+        
+        if waiting:
+            # wait() only raises if this caller is cancelled, not if an owner was
+            await asyncio.wait(set(waiting.values()))
+            retry = [i for i, future in waiting.items() if future.cancelled()]
+            for i, future in waiting.items():
+                if not future.cancelled():
+                    # Raises the owner's error if its computation failed
+                    results[i] = future.result()
+            
+            if retry:
+                # The owning request was cancelled mid-computation; compute these here
+                embeddings = await self.get_or_compute_many([texts[i] for i in retry], model)
+                for i, embedding in zip(retry, embeddings):
+                    results[i] = embedding
+        
+        return results
+    
+    async def _compute(
+        self,
+        texts: List[str],
+        model: str,
+        misses: Dict[bytes, List[int]],
+        results: List[List[float]],
+    ) -> None:
+        """Embed the missed texts, fill results and publish them to cache and waiters."""
+        loop = asyncio.get_running_loop()
+        owned = {key: loop.create_future() for key in misses}
+        self._inflight.update(owned)
+        
+        try:
+            embeddings = await ollama_service.generate_embeddings(
+                model=model,
+                text=[texts[indices[0]] for indices in misses.values()],
+            )
+            
+            for (key, indices), embedding in zip(misses.items(), embeddings):
+                if embedding:
+                    self._cache[key] = np.asarray(embedding, dtype=np.float32)
+                owned[key].set_result(embedding)
+                for i in indices:
+                    results[i] = embedding
+        except asyncio.CancelledError:
+            # Cancelled futures tell waiters to compute for themselves; resolving
+            # them with [] would hand every waiter an empty embedding
+            for future in owned.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # Mark retrieved so futures without waiters don't log at GC
+                    future.exception()
+            raise
+        finally:
+            for key, future in owned.items():
+                if not future.done():
+                    # Model returned fewer embeddings than requested
+                    future.set_result([])
+                self._inflight.pop(key, None)
+
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache()
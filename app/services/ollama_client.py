@@ -1,11 +1,29 @@
 """Ollama client service for model interaction."""
+import asyncio
+import time
 import httpx
-from typing import List, Dict, Any, Optional, AsyncIterator, Union
+import orjson
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, Union
 from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class _BearerAuth(httpx.Auth):
+    """Bearer token auth with the header value built once."""
+    
+    def __init__(self, token: str):
+        """Precompute the Authorization header value."""
+        self._header_value = f"Bearer {token}"
+    
+    def auth_flow(self, request: httpx.Request):
+        """Attach the Authorization header to the outgoing request."""
+        request.headers["Authorization"] = self._header_value
+        yield request
+
 
 class OllamaService:
     """Service for interacting with Ollama API."""
@@ -14,10 +32,35 @@ class OllamaService:
         """Initialize Ollama client."""
         self.base_url = settings.ollama_base_url
         self.api_key = settings.ollama_api_key
+        # Pooled keep-alive connections (HTTP/2 when available) shared by all requests;
+        # the transport also retries transient connect failures
+        transport = httpx.AsyncHTTPTransport(
+            http2=settings.ollama_http2,
+            limits=httpx.Limits(
+                max_connections=settings.ollama_max_connections,
+                max_keepalive_connections=settings.ollama_max_keepalive_connections,
+                keepalive_expiry=settings.ollama_keepalive_expiry,
+            ),
+            retries=settings.ollama_transport_retries,
+        )
         self.client = httpx.AsyncClient(
             base_url=self.base_url,
-            headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else {},
-            timeout=120.0,
+            auth=_BearerAuth(self.api_key) if self.api_key else None,
+            timeout=httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0),
+            transport=transport,
+        )
+        # Caps in-flight embedding requests when inputs are split or fanned out
+        self._embed_semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
+        # Cached /api/tags result as (monotonic fetch time, models); the lock lets
+        # one caller refresh it while concurrent callers wait for that result
+        self._models_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+        self._models_lock = asyncio.Lock()
+        self._models_refresh: Optional[asyncio.Task] = None
+    
+    def _build_json_request(self, path: str, payload: Dict[str, Any]) -> httpx.Request:
+        """Build a POST request with an orjson-encoded body."""
+        return self.client.build_request(
+            "POST", path, content=orjson.dumps(payload), headers=_JSON_HEADERS
         )
     
     async def generate_completion(
@@ -45,7 +88,7 @@ class OllamaService:
             # Add any additional parameters
             payload.update(kwargs)
             
-            response = await self.client.post("/api/chat", json=payload)
+            response = await self.client.send(self._build_json_request("/api/chat", payload))
             response.raise_for_status()
             
             return response.json()
@@ -59,8 +102,8 @@ class OllamaService:
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         **kwargs,
-    ) -> AsyncIterator[str]:
-        """Generate streaming chat completion."""
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Generate streaming chat completion, yielding parsed NDJSON chunks."""
         try:
             payload = {
                 "model": model,
@@ -70,37 +113,148 @@ class OllamaService:
             }
             payload.update(kwargs)
             
-            async with self.client.stream("POST", "/api/chat", json=payload) as response:
+            response = await self.client.send(
+                self._build_json_request("/api/chat", payload), stream=True
+            )
+            try:
                 response.raise_for_status()
-                async for line in response.aiter_lines():
-                    if line:
-                        yield line
+                # No chunk_size: a fixed size would hold tokens back until it fills
+                async for chunk in self._iter_stream_chunks(response.aiter_bytes()):
+                    yield chunk
+            finally:
+                await response.aclose()
         except Exception as e:
             logger.error(f"Error in streaming completion: {e}")
             raise
     
+    @classmethod
+    async def _iter_stream_chunks(cls, data: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+        """Split a byte stream into NDJSON lines and yield each parsed object."""
+        # Buffer raw bytes and only parse complete newline-terminated objects
+        buffer = b""
+        async for block in data:
+            buffer += block
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                chunk = cls._parse_stream_line(line)
+                if chunk is not None:
+                    yield chunk
+        
+        # The final object may lack a trailing newline
+        chunk = cls._parse_stream_line(buffer)
+        if chunk is not None:
+            yield chunk
+    
+    @staticmethod
+    def _parse_stream_line(line: bytes) -> Optional[Dict[str, Any]]:
+        """Parse a single NDJSON line, skipping blank or malformed lines."""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            logger.debug("Skipping malformed stream line")
+            return None
+    
     async def generate_embeddings(self, model: str, text: Union[str, List[str]]) -> List[List[float]]:
-        """Generate embeddings for text."""
+        """Generate embeddings for text, batching inputs into as few requests as possible."""
         try:
             texts = [text] if isinstance(text, str) else text
-            embeddings = []
+            if not texts:
+                return []
             
-            for txt in texts:
-                payload = {"model": model, "prompt": txt}
-                response = await self.client.post("/api/embeddings", json=payload)
-                response.raise_for_status()
-                result = response.json()
-                embeddings.append(result.get("embedding", []))
+            batch_size = settings.embedding_batch_size
+            if len(texts) <= batch_size:
+                return await self._embed_batch(model, texts)
             
-            return embeddings
+            # Split very large inputs into bounded batches and embed them concurrently
+            batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+            results = await asyncio.gather(*[self._embed_batch(model, batch) for batch in batches])
+            return [embedding for batch_embeddings in results for embedding in batch_embeddings]
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
     
+    async def _send_embedding_request(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """Send one embedding request while holding the concurrency semaphore."""
+        async with self._embed_semaphore:
+            return await self.client.send(self._build_json_request(path, payload))
+    
+    async def _embed_batch(self, model: str, texts: List[str]) -> List[List[float]]:
+        """Embed one batch of texts with a single /api/embed request."""
+        # /api/embed accepts a list of inputs, so N texts cost one round-trip
+        payload = {"model": model, "input": texts}
+        response = await self._send_embedding_request("/api/embed", payload)
+        
+        if response.status_code == 404:
+            # Older servers only expose the single-prompt endpoint; fan out concurrently
+            return await self._generate_embeddings_legacy(model, texts)
+        
+        response.raise_for_status()
+        result = response.json()
+        return result.get("embeddings", [])
+    
+    async def _generate_embeddings_legacy(self, model: str, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings via the per-prompt /api/embeddings endpoint."""
+        responses = await asyncio.gather(*[
+            self._send_embedding_request("/api/embeddings", {"model": model, "prompt": txt})
+            for txt in texts
+        ])
+        
+        embeddings = []
+        for response in responses:
+            response.raise_for_status()
+            embeddings.append(response.json().get("embedding", []))
+        
+        return embeddings
+    
     async def list_models(self) -> List[Dict[str, Any]]:
-        """List available models."""
+        """
+        List available models.
+        
+        The list is cached for OLLAMA_MODELS_CACHE_TTL seconds. Once 80% of the TTL
+        has elapsed, a single background refresh starts while callers keep getting
+        the cached list, so a busy endpoint never waits on /api/tags.
+        """
+        ttl = settings.ollama_models_cache_ttl
+        if ttl <= 0:
+            return await self._fetch_models()
+        
+        cached = self._models_cache
+        if cached is not None:
+            age = time.monotonic() - cached[0]
+            if age < ttl:
+                if age >= 0.8 * ttl and (self._models_refresh is None or self._models_refresh.done()):
+                    self._models_refresh = asyncio.create_task(self._refresh_models_in_background())
+                return cached[1]
+        
+        return await self._refresh_models()
+    
+    async def _refresh_models(self, timeout: Any = httpx.USE_CLIENT_DEFAULT) -> List[Dict[str, Any]]:
+        """Fetch the model list once for all concurrent callers and cache it."""
+        async with self._models_lock:
+            # Another caller may have refreshed it while we waited for the lock
+            cached = self._models_cache
+            if cached is not None and time.monotonic() - cached[0] < 0.8 * settings.ollama_models_cache_ttl:
+                return cached[1]
+            
+            models = await self._fetch_models(timeout)
+            self._models_cache = (time.monotonic(), models)
+            return models
+    
+    async def _refresh_models_in_background(self) -> None:
+        """Refresh the cached model list, keeping the old one on failure."""
+        try:
+            await self._refresh_models()
+        except Exception:
+            # Already logged; the cached list serves until it expires
+            pass
+    
+    async def _fetch_models(self, timeout: Any = httpx.USE_CLIENT_DEFAULT) -> List[Dict[str, Any]]:
+        """Fetch the model list from Ollama."""
         try:
-            response = await self.client.get("/api/tags")
+            response = await self.client.get("/api/tags", timeout=timeout)
             response.raise_for_status()
             result = response.json()
             return result.get("models", [])
@@ -108,8 +262,23 @@ class OllamaService:
             logger.error(f"Error listing models: {e}")
             raise
     
+    async def warmup(self) -> None:
+        """
+        Open a pooled connection to Ollama ahead of the first request.
+        
+        Also primes the model list cache. Best-effort: failures are logged and
+        never block startup for long.
+        """
+        try:
+            await self._refresh_models(timeout=5.0)
+            logger.info("Ollama connection warmed up")
+        except Exception as e:
+            logger.warning(f"Ollama warmup failed, first request will connect: {e}")
+    
     async def close(self):
         """Close the HTTP client."""
+        if self._models_refresh is not None:
+            self._models_refresh.cancel()
         await self.client.aclose()
 
 
@@ -1,14 +1,41 @@
 """RAG service for retrieval-augmented generation."""
-from typing import List, Dict, Any, Optional
-from sqlalchemy import select
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
+from cachetools import TTLCache
+from hashlib import sha1
+from sqlalchemy import Float, Select, cast, func, insert, literal, select, union_all
+from pgvector.sqlalchemy import BIT, HALFVEC
 from app.db.models import Document
 from app.db.database import get_db_session
-from app.services.ollama_client import ollama_service
+from app.services.embedding_cache import embedding_cache
 from app.core.config import settings
+import asyncio
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Search result field -> Document column it is read from
+_SEARCH_FIELDS = {"content": "content", "metadata": "doc_metadata", "collection": "collection"}
+
+# (query, collection, top_k, fields) for one similarity search
+SearchRequest = Tuple[str, Optional[str], int, Sequence[str]]
+
+# Prompt wrapped around retrieved context by augment_prompt
+_AUGMENTED_PROMPT_TEMPLATE = """Based on the following relevant documents, please answer the question.
+
+Context:
+{context}
+
+Question: {query}
+
+Please provide a detailed answer based on the context provided."""
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    """L2-normalize an embedding so inner product equals cosine similarity."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) + 1e-12)
+
 
 class RAGService:
     """Service for Retrieval-Augmented Generation."""
@@ -17,125 +44,295 @@ class RAGService:
         """Initialize RAG service."""
         self.embedding_model = settings.embedding_model
         self.top_k = settings.top_k_results
+        self.ingest_batch_size = settings.rag_ingest_batch_size
+        
+        # Augmented prompts keyed by (generation, collection, query digest). The
+        # generation is bumped on every ingest in this process; ingests served by
+        # other workers or replicas only show up once the TTL expires.
+        self._prompt_cache: Optional[TTLCache] = (
+            TTLCache(maxsize=4096, ttl=settings.rag_prompt_cache_ttl)
+            if settings.rag_prompt_cache_ttl > 0 else None
+        )
+        self._generation = 0
+        
+        # Binary-quantized candidate search with exact rerank
+        self.binary_quantization = settings.rag_binary_quantization
+        self.rerank_factor = settings.rag_rerank_factor
+        
+        # Micro-batching of concurrent similarity searches
+        self.batch_window = settings.rag_batch_window_ms / 1000
+        self.batch_max_size = settings.rag_batch_max_size
+        self._pending_searches: List[Tuple[SearchRequest, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batch_tasks: set = set()
     
     async def ingest_documents(
         self,
         documents: List[Dict[str, Any]],
+        on_batch: Optional[Callable[[int], None]] = None,
     ) -> int:
         """
         Ingest documents into the vector database.
         
+        Documents are embedded and committed in batches, so if a batch fails the
+        batches before it stay committed.
+        
         Args:
             documents: List of documents with 'content', 'metadata', and 'collection'
+            on_batch: Called with the running count of committed documents after each batch
         
         Returns:
             Number of documents ingested
         """
+        if not documents:
+            return 0
+        
+        # Embedding of batch K+1 overlaps with the insert of batch K; the bounded
+        # queue keeps the embedder at most two batches ahead of the database
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+        producer = asyncio.create_task(self._embed_batches(documents, queue))
         ingested_count = 0
         
-        async with get_db_session() as session:
-            for doc in documents:
-                try:
-                    content = doc.get("content", "")
-                    metadata = doc.get("metadata", {})
-                    collection = doc.get("collection", "default")
-                    
-                    # Generate embedding
-                    embeddings = await ollama_service.generate_embeddings(
-                        model=self.embedding_model,
-                        text=content
-                    )
-                    
-                    if embeddings and len(embeddings) > 0:
-                        embedding = embeddings[0]
-                        
-                        # Create document record
-                        db_doc = Document(
-                            content=content,
-                            embedding=embedding,
-                            doc_metadata=metadata,
-                            collection=collection,
-                        )
-                        
-                        session.add(db_doc)
-                        ingested_count += 1
-                except Exception as e:
-                    logger.error(f"Error ingesting document: {e}")
-                    continue
+        try:
+            while (rows := await queue.get()) is not None:
+                # Each batch commits in its own transaction; a failure rolls back only that batch
+                async with get_db_session() as session:
+                    await session.execute(insert(Document), rows)
+                ingested_count += len(rows)
+                self._generation += 1
+                if on_batch is not None:
+                    on_batch(ingested_count)
             
-            await session.commit()
+            # Surface embedding errors that ended the stream early
+            await producer
+        finally:
+            producer.cancel()
         
         logger.info(f"Ingested {ingested_count} documents")
         return ingested_count
     
+    async def _embed_batches(self, documents: List[Dict[str, Any]], queue: asyncio.Queue) -> None:
+        """
+        Embed documents batch by batch and queue the rows to insert.
+        
+        Args:
+            documents: Documents to embed
+            queue: Receives one list of insert rows per batch, then None
+        """
+        try:
+            for start in range(0, len(documents), self.ingest_batch_size):
+                batch = documents[start:start + self.ingest_batch_size]
+                # Duplicates of cached text are not re-embedded
+                contents = [doc.get("content", "") for doc in batch]
+                embeddings = await embedding_cache.get_or_compute_many(
+                    contents, self.embedding_model
+                )
+                
+                rows = []
+                for doc, content, embedding in zip(batch, contents, embeddings):
+                    if not embedding:
+                        logger.error("Error ingesting document: empty embedding returned")
+                        continue
+                    rows.append({
+                        "content": content,
+                        "embedding": _normalize(embedding),
+                        "doc_metadata": doc.get("metadata", {}),
+                        "collection": doc.get("collection", "default"),
+                    })
+                
+                if rows:
+                    await queue.put(rows)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Let the consumer stop, then re-raise from the awaited task
+            await queue.put(None)
+            raise
+        
+        await queue.put(None)
+    
     async def search_similar(
         self,
         query: str,
         collection: Optional[str] = None,
         top_k: Optional[int] = None,
+        fields: Sequence[str] = tuple(_SEARCH_FIELDS),
     ) -> List[Dict[str, Any]]:
         """
         Search for similar documents using vector similarity.
         
+        Concurrent searches are coalesced into one embedding call and one SQL
+        round-trip. While a batch is in flight, new searches wait up to the batch
+        window to join the next one; on an idle service a search runs on the next
+        loop iteration, so a lone search is not delayed.
+        
         Args:
             query: Search query
             collection: Optional collection filter
             top_k: Number of results to return
+            fields: Result fields to fetch ("content", "metadata", "collection")
         
         Returns:
-            List of similar documents with content and metadata
+            List of similar documents with the requested fields and a similarity score
         """
         if top_k is None:
             top_k = self.top_k
         
+        if self.batch_window <= 0:
+            results = await self._search_batch([(query, collection, top_k, fields)])
+            return results[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending_searches.append(((query, collection, top_k, fields), future))
+        
+        if len(self._pending_searches) >= self.batch_max_size:
+            # Batch is full; run it now instead of waiting out the window
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+            self._run_pending()
+        elif self._flush_task is None:
+            # With no batch in flight there is nothing worth waiting for: flush on the
+            # next loop iteration, which still coalesces searches issued together
+            delay = self.batch_window if self._batch_tasks else 0
+            self._flush_task = asyncio.create_task(self._flush_after_window(delay))
+        
+        return await future
+    
+    async def _flush_after_window(self, delay: float) -> None:
+        """Wait for the batch window to close, then run the pending searches."""
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        self._run_pending()
+    
+    def _run_pending(self) -> None:
+        """Detach the pending searches and run them as one batch in the background."""
+        batch, self._pending_searches = self._pending_searches, []
+        task = asyncio.create_task(self._resolve_batch(batch))
+        # Hold a reference so the task is not garbage collected mid-flight
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _resolve_batch(
+        self,
+        batch: List[Tuple[SearchRequest, asyncio.Future]],
+    ) -> None:
+        """Run a batch of searches and resolve each caller's future."""
+        results = await self._search_batch([request for request, _ in batch])
+        for (_, future), documents in zip(batch, results):
+            if not future.done():
+                future.set_result(documents)
+    
+    async def _search_batch(
+        self,
+        requests: List[SearchRequest],
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries with one embedding call and one SQL statement.
+        
+        Every branch selects the union of the fields the batch asked for (UNION ALL
+        needs matching columns); each result only carries its own request's fields.
+        
+        Args:
+            requests: (query, collection, top_k, fields) tuples
+        
+        Returns:
+            One result list per request, in request order
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in requests]
+        if not requests:
+            return results
+        
         try:
-            # Generate query embedding
-            embeddings = await ollama_service.generate_embeddings(
-                model=self.embedding_model,
-                text=query
+            # Generate all uncached query embeddings in one call
+            embeddings = await embedding_cache.get_or_compute_many(
+                [query for query, *_ in requests],
+                self.embedding_model,
             )
             
-            if not embeddings or len(embeddings) == 0:
-                logger.warning("Failed to generate query embedding")
-                return []
+            requested = set().union(*(fields for *_, fields in requests))
+            columns = [column for field, column in _SEARCH_FIELDS.items() if field in requested]
+            
+            # One ORDER BY/LIMIT branch per query, combined with UNION ALL
+            branches = []
+            for i, ((_, collection, top_k, _), embedding) in enumerate(zip(requests, embeddings)):
+                if not embedding:
+                    logger.warning("Failed to generate query embedding")
+                    continue
+                
+                branches.append(
+                    self._search_branch(i, _normalize(embedding), collection, top_k, columns)
+                )
+            
+            if not branches:
+                return results
             
-            query_embedding = embeddings[0]
+            stmt = branches[0] if len(branches) == 1 else union_all(*branches)
             
             async with get_db_session() as session:
-                # Build query with error handling for vector operations
-                try:
-                    stmt = select(
-                        Document.content,
-                        Document.doc_metadata,
-                        Document.collection,
-                        Document.embedding.cosine_distance(query_embedding).label("distance")
-                    )
-                except Exception as e:
-                    logger.error(f"Vector operation failed, pgvector may not be available: {e}")
-                    return []
-                
-                if collection:
-                    stmt = stmt.where(Document.collection == collection)
-                
-                stmt = stmt.order_by("distance").limit(top_k)
-                
                 result = await session.execute(stmt)
                 rows = result.all()
-                
-                # Format results
-                documents = []
-                for row in rows:
-                    documents.append({
-                        "content": row.content,
-                        "metadata": row.doc_metadata,
-                        "collection": row.collection,
-                        "similarity_score": 1 - row.distance,  # Convert distance to similarity
-                    })
-                
-                return documents
+            
+            # Format results, grouped back per query
+            for row in sorted(rows, key=lambda r: r.distance):
+                fields = requests[row.query_index][3]
+                document = {field: getattr(row, _SEARCH_FIELDS[field]) for field in fields}
+                # <#> returns the negative inner product
+                document["similarity_score"] = -row.distance
+                results[row.query_index].append(document)
+            
+            return results
         except Exception as e:
             logger.error(f"Error searching similar documents: {e}")
-            return []
+            return results
+    
+    def _search_branch(
+        self,
+        query_index: int,
+        query_vector: np.ndarray,
+        collection: Optional[str],
+        top_k: int,
+        columns: Sequence[str],
+    ) -> Select:
+        """
+        Build the top-k similarity SELECT for one query.
+        
+        With binary quantization enabled, candidates are first ranked by Hamming
+        distance over the sign-bit index, then reranked by exact inner product.
+        Only the given Document columns are selected, plus the distance.
+        """
+        if not self.binary_quantization:
+            # Stored vectors are unit length, so negative inner product ranks like cosine
+            distance = Document.embedding.max_inner_product(query_vector)
+            stmt = select(
+                literal(query_index).label("query_index"),
+                *[getattr(Document, column) for column in columns],
+                distance.label("distance"),
+            )
+            if collection:
+                stmt = stmt.where(Document.collection == collection)
+            return stmt.order_by(distance).limit(top_k)
+        
+        # Expression must match the binary_quantize HNSW index created in init_db
+        dimension = settings.vector_dimension
+        hamming = cast(func.binary_quantize(Document.embedding), BIT(dimension)).op(
+            "<~>", return_type=Float
+        )(func.binary_quantize(cast(query_vector, HALFVEC(dimension))))
+        
+        candidates = select(
+            *[getattr(Document, column) for column in columns],
+            Document.embedding,
+        )
+        if collection:
+            candidates = candidates.where(Document.collection == collection)
+        candidates = candidates.order_by(hamming).limit(top_k * self.rerank_factor).subquery()
+        
+        distance = candidates.c.embedding.max_inner_product(query_vector)
+        return select(
+            literal(query_index).label("query_index"),
+            *[candidates.c[column] for column in columns],
+            distance.label("distance"),
+        ).order_by(distance).limit(top_k)
     
     async def augment_prompt(
         self,
@@ -152,28 +349,27 @@ class RAGService:
         Returns:
             Augmented prompt with context
         """
-        documents = await self.search_similar(query, collection)
+        cache_key = (self._generation, collection, sha1(query.encode()).digest())
+        if self._prompt_cache is not None:
+            cached = self._prompt_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        # Only content goes into the prompt; skip transferring metadata
+        documents = await self.search_similar(query, collection, fields=("content",))
         
         if not documents:
             return query
         
-        # Build context from retrieved documents
-        context_parts = []
-        for i, doc in enumerate(documents, 1):
-            context_parts.append(f"[Document {i}]\n{doc['content']}\n")
-        
-        context = "\n".join(context_parts)
+        # Build context from retrieved documents in one join
+        context = "\n".join(
+            f"[Document {i}]\n{doc['content']}\n" for i, doc in enumerate(documents, 1)
+        )
         
-        # Construct augmented prompt
-        augmented_prompt = f"""Based on the following relevant documents, please answer the question.
-
-Context:
-{context}
-
-Question: {query}
-
-Please provide a detailed answer based on the context provided."""
+        augmented_prompt = _AUGMENTED_PROMPT_TEMPLATE.format(context=context, query=query)
         
+        if self._prompt_cache is not None:
+            self._prompt_cache[cache_key] = augmented_prompt
         return augmented_prompt
 
 
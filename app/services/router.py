@@ -1,13 +1,44 @@
 """DSPy-based routing service for Mixture of Experts."""
+import ahocorasick
+import asyncio
 import dspy
-from typing import List, Dict, Any, Tuple
+import itertools
+from hashlib import blake2b
+from types import MappingProxyType
+from typing import List, Dict, Any, FrozenSet, Mapping, Optional, Tuple
+from cachetools import LRUCache
 from app.core.config import settings
-from app.services.ollama_client import ollama_service
+from app.services.ollama_client import OllamaService, ollama_service
 import logging
-import re
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# (required keyword categories, model, use_rag override or None, log reason)
+RoutingRule = Tuple[FrozenSet[str], str, Optional[bool], str]
+
+# Background event loop that serves synchronous OllamaLM calls, started on first use,
+# with its own Ollama client: httpx pools and asyncio primitives are bound to one loop
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_service: Optional[OllamaService] = None
+_sync_loop_lock = threading.Lock()
+
+
+def _get_sync_runtime() -> Tuple[asyncio.AbstractEventLoop, OllamaService]:
+    """Return the shared background loop and its client, starting the thread if needed."""
+    global _sync_loop, _sync_service
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            _sync_service = OllamaService()
+            threading.Thread(
+                target=_sync_loop.run_forever,
+                name="ollama-lm-sync-loop",
+                daemon=True,
+            ).start()
+    return _sync_loop, _sync_service
+
 
 class OllamaLM(dspy.LM):
     """Custom DSPy Language Model wrapper for Ollama."""
@@ -21,25 +52,37 @@ class OllamaLM(dspy.LM):
     def __call__(self, prompt: str, **kwargs) -> str:
         """
         Synchronous call wrapper for compatibility.
-        Note: This is a simple wrapper. For production use with DSPy,
-        implement proper async handling or use DSPy's async capabilities.
+        
+        Only valid outside a running event loop; async code must use acall.
         """
-        import asyncio
         try:
-            # Try to get or create event loop for sync context
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # If loop is already running, we can't use run_until_complete
-                logger.warning("Cannot make sync call in async context, use acall instead")
-                return ""
-            return loop.run_until_complete(self.acall([{"role": "user", "content": prompt}], **kwargs))
+            asyncio.get_running_loop()
         except RuntimeError:
-            # No event loop available, create one
-            return asyncio.run(self.acall([{"role": "user", "content": prompt}], **kwargs))
+            pass
+        else:
+            raise RuntimeError(
+                "OllamaLM cannot be called synchronously inside an event loop; use acall"
+            )
+        
+        loop, service = _get_sync_runtime()
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(service, [{"role": "user", "content": prompt}], **kwargs),
+            loop,
+        )
+        return future.result()
     
     async def acall(self, messages: List[Dict[str, Any]], **kwargs) -> str:
         """Async call to Ollama."""
-        response = await ollama_service.generate_completion(
+        return await self._complete(ollama_service, messages, **kwargs)
+    
+    async def _complete(
+        self,
+        service: OllamaService,
+        messages: List[Dict[str, Any]],
+        **kwargs,
+    ) -> str:
+        """Run a chat completion on the given client and return the message content."""
+        response = await service.generate_completion(
             model=self.model,
             messages=messages,
             **kwargs
@@ -71,6 +114,31 @@ class MoERouter:
     AGGREGATION_KEYWORDS = ["summarize", "combine", "aggregate", "synthesize", "merge", "consolidate"]
     RAG_KEYWORDS = ["search", "find", "lookup", "retrieve", "document", "knowledge base"]
     
+    # Characters lowercased per scan window, so long prompts are never copied whole
+    SCAN_WINDOW = 8192
+    
+    @staticmethod
+    def _build_classifier(categories: Dict[str, List[str]]) -> ahocorasick.Automaton:
+        """
+        Build one Aho-Corasick automaton over all keyword categories.
+        
+        Args:
+            categories: Mapping of category name to its keywords
+        
+        Returns:
+            Automaton whose values are the set of categories each keyword belongs to
+        """
+        labels: Dict[str, FrozenSet[str]] = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                labels[keyword] = labels.get(keyword, frozenset()) | {category}
+        
+        automaton = ahocorasick.Automaton()
+        for keyword, keyword_categories in labels.items():
+            automaton.add_word(keyword, keyword_categories)
+        automaton.make_automaton()
+        return automaton
+    
     def __init__(self):
         """Initialize the MoE router with Ollama Cloud models."""
         # Primary models
@@ -107,16 +175,161 @@ class MoERouter:
             self.vision_thinking_model: [self.vision_model, self.fallback_model],
         }
         
+        # Model configuration is fixed after startup, so these views are built once
+        self._all_expert_models: Tuple[str, ...] = (
+            self.reasoning_model,
+            self.fallback_model,
+            self.enterprise_model,
+            self.math_tool_model,
+            self.code_model,
+            self.aggregator_model,
+            self.cost_code_model,
+            self.vision_model,
+            self.vision_thinking_model,
+        )
+        self._model_info: Mapping[str, Any] = MappingProxyType({
+            "reasoning": self.reasoning_model,
+            "fallback": self.fallback_model,
+            "enterprise": self.enterprise_model,
+            "math_tool": self.math_tool_model,
+            "code": self.code_model,
+            "aggregator": self.aggregator_model,
+            "cost_code": self.cost_code_model,
+            "vision": self.vision_model,
+            "vision_thinking": self.vision_thinking_model,
+            "default": self.default_model,
+            "backup_strategy": MappingProxyType(self.backup_chain),
+        })
+        
         # Circuit breaker state: tracks failures per model
         self.failure_counts: Dict[str, int] = {}
-        self.quarantined_models: set = set()
+        self.quarantined_models: Dict[str, float] = {}  # model -> monotonic time quarantine ends
         
         # Failover configuration
         self.max_latency_ms = settings.max_latency_ms
         self.max_retries = settings.max_retries
         self.circuit_breaker_threshold = settings.circuit_breaker_threshold
+        self.circuit_breaker_cooldown = settings.circuit_breaker_cooldown
+        self.circuit_breaker_max_cooldown = settings.circuit_breaker_max_cooldown
         self.retry_backoff_factor = settings.retry_backoff_factor
         self.retry_initial_delay = settings.retry_initial_delay
+        
+        # Single automaton over every keyword list: one pass per message
+        self._classifier = self._build_classifier({
+            "code": self.CODE_KEYWORDS,
+            "simple_code": self.SIMPLE_CODE_KEYWORDS,
+            "math_tool": self.MATH_TOOL_KEYWORDS,
+            "reasoning": self.REASONING_KEYWORDS,
+            "enterprise": self.ENTERPRISE_KEYWORDS,
+            "aggregation": self.AGGREGATION_KEYWORDS,
+            "rag": self.RAG_KEYWORDS,
+        })
+        # Windows overlap by this much so no keyword is split across a boundary
+        self._scan_overlap = len(max(self._classifier.keys(), key=len)) - 1
+        
+        # Low-confidence phrases, matched as substrings in one scan per response
+        self._confidence_matcher = (
+            self._build_classifier({"low_confidence": settings.confidence_keywords})
+            if settings.confidence_keywords
+            else None
+        )
+        
+        # Priority tables of (required categories, model, use_rag override, reason);
+        # the first rule whose categories all matched wins, the last always matches
+        self._vision_rules: Tuple[RoutingRule, ...] = (
+            # Priority 1: Vision tasks (multimodal), with or without complex reasoning
+            (frozenset({"reasoning"}), self.vision_thinking_model, False,
+             "Routing to vision+thinking model for multimodal reasoning"),
+            (frozenset({"math_tool"}), self.vision_thinking_model, False,
+             "Routing to vision+thinking model for multimodal reasoning"),
+            (frozenset(), self.vision_model, False,
+             "Routing to vision model for GUI/visual tasks"),
+        )
+        self._text_rules: Tuple[RoutingRule, ...] = (
+            # Priority 2: Code generation/debugging, cost-effective when simple
+            (frozenset({"code", "simple_code"}), self.cost_code_model, False,
+             "Routing to cost-effective code model"),
+            (frozenset({"code"}), self.code_model, False,
+             "Routing to advanced code model"),
+            # Priority 3: Math/tool-calling/agentic workflows
+            (frozenset({"math_tool"}), self.math_tool_model, None,
+             "Routing to math/tool-calling model"),
+            # Priority 4: Complex reasoning (long-form, audit trails)
+            (frozenset({"reasoning"}), self.reasoning_model, None,
+             "Routing to complex reasoning model"),
+            # Priority 5: Enterprise deep reasoning (multi-turn, production-grade)
+            (frozenset({"enterprise"}), self.enterprise_model, None,
+             "Routing to enterprise model"),
+            # Priority 6: Aggregation tasks (multi-expert synthesis)
+            (frozenset({"aggregation"}), self.aggregator_model, None,
+             "Routing to aggregator model"),
+            # Priority 7: RAG-related queries
+            (frozenset({"rag"}), self.fallback_model, True,
+             "Routing to fallback model with RAG enabled"),
+            # Default: Low-latency fallback for generic queries
+            (frozenset(), self.fallback_model, None,
+             "Routing to default fallback model"),
+        )
+        
+        # Decisions memoized per instance so identical retried/replayed messages skip
+        # the scan; keyed by message digest so large prompts are never kept alive
+        self._route_cache: Optional[LRUCache] = (
+            LRUCache(maxsize=settings.route_cache_size) if settings.route_cache_size > 0 else None
+        )
+    
+    def _match_categories(self, text: str) -> FrozenSet[str]:
+        """
+        Return every keyword category found in text, matched case-insensitively.
+        
+        Text is lowercased one bounded window at a time rather than as a full
+        copy of the prompt.
+        """
+        matched: FrozenSet[str] = frozenset()
+        for start in range(0, len(text), self.SCAN_WINDOW):
+            window = text[start:start + self.SCAN_WINDOW + self._scan_overlap].lower()
+            for _, categories in self._classifier.iter(window):
+                matched |= categories
+        return matched
+    
+    @staticmethod
+    def _last_user_content(messages: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        """
+        Find the text of the last user message and whether it carries images.
+        
+        Args:
+            messages: Chat messages, oldest first
+        
+        Returns:
+            tuple of (text, has_images); text is empty if there is no user message
+        """
+        # The last message is usually the user's turn; only scan back when it isn't
+        msg = messages[-1] if messages else None
+        if msg is not None and msg.get("role") != "user":
+            msg = next((m for m in reversed(messages) if m.get("role") == "user"), None)
+        if msg is None:
+            return "", False
+        
+        content = msg.get("content", "")
+        if isinstance(content, str):
+            return content, False
+        
+        text = None
+        has_images = False
+        if isinstance(content, list):
+            # Multi-modal content: the last text part wins, so walk backwards
+            # and stop once both a text part and an image have been seen
+            for item in reversed(content):
+                if not isinstance(item, dict):
+                    continue
+                if item.get("type") == "text":
+                    if text is None:
+                        text = item.get("text", "")
+                elif item.get("type") == "image_url":
+                    has_images = True
+                if text is not None and has_images:
+                    break
+        
+        return text or "", has_images
     
     async def route_request(
         self,
@@ -130,74 +343,70 @@ class MoERouter:
             tuple of (model_name, use_rag_flag)
         """
         # Extract last user message for routing decision
-        last_message = ""
-        has_images = False
+        last_message, has_images = self._last_user_content(messages)
+        return self._route_with_features(last_message, has_images, use_rag)
+    
+    def _route_with_features(
+        self,
+        last_message: str,
+        has_images: bool,
+        use_rag: bool,
+    ) -> Tuple[str, bool]:
+        """
+        Route from already-extracted message features.
+        
+        Args:
+            last_message: Text of the last user message
+            has_images: Whether that message carries images
+            use_rag: Caller's RAG flag, kept unless the matched rule overrides it
+        
+        Returns:
+            tuple of (model_name, use_rag_flag)
+        """
+        model, rag_override, reason = self._classify(last_message, has_images)
+        logger.info(reason)
+        return model, use_rag if rag_override is None else rag_override
+    
+    def _classify(
+        self,
+        last_message: str,
+        has_images: bool,
+    ) -> Tuple[str, Optional[bool], str]:
+        """Classify a message, memoized on (message digest, has_images)."""
+        if self._route_cache is None:
+            return self._classify_uncached(last_message, has_images)
+        
+        key = (blake2b(last_message.encode(), digest_size=16).digest(), has_images)
+        decision = self._route_cache.get(key)
+        if decision is None:
+            decision = self._classify_uncached(last_message, has_images)
+            self._route_cache[key] = decision
+        return decision
+    
+    def _classify_uncached(
+        self,
+        last_message: str,
+        has_images: bool,
+    ) -> Tuple[str, Optional[bool], str]:
+        """
+        Pick the expert model for a message by keyword priority.
+        
+        Args:
+            last_message: Text of the last user message
+            has_images: Whether that message carries images
+        
+        Returns:
+            tuple of (model_name, use_rag override or None to keep the caller's flag, reason)
+        """
+        matched = self._match_categories(last_message)
+        rules = self._vision_rules if has_images else self._text_rules
+        
+        for required, model, rag_override, reason in rules:
+            if required <= matched:
+                return model, rag_override, reason
         
-        for msg in reversed(messages):
-            if msg.get("role") == "user":
-                content = msg.get("content", "")
-                if isinstance(content, str):
-                    last_message = content
-                elif isinstance(content, list):
-                    # Multi-modal content
-                    for item in content:
-                        if isinstance(item, dict):
-                            if item.get("type") == "text":
-                                last_message = item.get("text", "")
-                            elif item.get("type") == "image_url":
-                                has_images = True
-                break
-        
-        lower_message = last_message.lower()
-        
-        # Priority 1: Vision tasks (multimodal)
-        if has_images:
-            # Check if complex reasoning with images is needed
-            if any(keyword in lower_message for keyword in self.REASONING_KEYWORDS + self.MATH_TOOL_KEYWORDS):
-                logger.info("Routing to vision+thinking model for multimodal reasoning")
-                return self.vision_thinking_model, False
-            else:
-                logger.info("Routing to vision model for GUI/visual tasks")
-                return self.vision_model, False
-        
-        # Priority 2: Code generation/debugging
-        if any(keyword in lower_message for keyword in self.CODE_KEYWORDS):
-            # Check if cost-effective coding is suitable
-            if any(keyword in lower_message for keyword in self.SIMPLE_CODE_KEYWORDS):
-                logger.info("Routing to cost-effective code model")
-                return self.cost_code_model, False
-            else:
-                logger.info("Routing to advanced code model")
-                return self.code_model, False
-        
-        # Priority 3: Math/tool-calling/agentic workflows
-        if any(keyword in lower_message for keyword in self.MATH_TOOL_KEYWORDS):
-            logger.info("Routing to math/tool-calling model")
-            return self.math_tool_model, use_rag
-        
-        # Priority 4: Complex reasoning (long-form, audit trails)
-        if any(keyword in lower_message for keyword in self.REASONING_KEYWORDS):
-            logger.info("Routing to complex reasoning model")
-            return self.reasoning_model, use_rag
-        
-        # Priority 5: Enterprise deep reasoning (multi-turn, production-grade)
-        if any(keyword in lower_message for keyword in self.ENTERPRISE_KEYWORDS):
-            logger.info("Routing to enterprise model")
-            return self.enterprise_model, use_rag
-        
-        # Priority 6: Aggregation tasks (multi-expert synthesis)
-        if any(keyword in lower_message for keyword in self.AGGREGATION_KEYWORDS):
-            logger.info("Routing to aggregator model")
-            return self.aggregator_model, use_rag
-        
-        # Priority 7: RAG-related queries
-        if any(keyword in lower_message for keyword in self.RAG_KEYWORDS):
-            logger.info("Routing to fallback model with RAG enabled")
-            return self.fallback_model, True
-        
-        # Default: Low-latency fallback for generic queries
-        logger.info("Routing to default fallback model")
-        return self.fallback_model, use_rag
+        # Unreachable: both tables end with a catch-all rule
+        return self.fallback_model, None, "Routing to default fallback model"
     
     def get_backup_models(self, primary_model: str) -> List[str]:
         """
@@ -205,27 +414,15 @@ class MoERouter:
         
         Args:
             primary_model: The primary model name
-            
+        
         Returns:
             List of backup model names (may be empty)
         """
         return self.backup_chain.get(primary_model, [])
     
-    def get_model_info(self) -> Dict[str, Any]:
-        """Get information about available models in the MoE."""
-        return {
-            "reasoning": self.reasoning_model,
-            "fallback": self.fallback_model,
-            "enterprise": self.enterprise_model,
-            "math_tool": self.math_tool_model,
-            "code": self.code_model,
-            "aggregator": self.aggregator_model,
-            "cost_code": self.cost_code_model,
-            "vision": self.vision_model,
-            "vision_thinking": self.vision_thinking_model,
-            "default": self.default_model,
-            "backup_strategy": self.backup_chain.copy()
-        }
+    def get_model_info(self) -> Mapping[str, Any]:
+        """Get information about available models in the MoE (read-only, built once)."""
+        return self._model_info
     
     def record_failure(self, model: str) -> None:
         """
@@ -234,11 +431,18 @@ class MoERouter:
         Args:
             model: The model that failed
         """
-        self.failure_counts[model] = self.failure_counts.get(model, 0) + 1
-        
-        if self.failure_counts[model] >= self.circuit_breaker_threshold:
-            self.quarantined_models.add(model)
-            logger.warning(f"Model {model} quarantined after {self.failure_counts[model]} failures")
+        count = self.failure_counts.get(model, 0) + 1
+        self.failure_counts[model] = count
+        
+        if count >= self.circuit_breaker_threshold:
+            # Cooldown grows with each failure past the threshold, i.e. each failed probe
+            excess = min(count - self.circuit_breaker_threshold, 32)
+            cooldown = min(
+                self.circuit_breaker_cooldown * self.retry_backoff_factor ** excess,
+                self.circuit_breaker_max_cooldown,
+            )
+            self.quarantined_models[model] = time.monotonic() + cooldown
+            logger.warning(f"Model {model} quarantined for {cooldown:.0f}s after {count} failures")
     
     def record_success(self, model: str) -> None:
         """
@@ -247,23 +451,35 @@ class MoERouter:
         Args:
             model: The model that succeeded
         """
-        if model in self.failure_counts:
-            del self.failure_counts[model]
-        if model in self.quarantined_models:
-            self.quarantined_models.remove(model)
+        self.failure_counts.pop(model, None)
+        if self.quarantined_models.pop(model, None) is not None:
             logger.info(f"Model {model} removed from quarantine")
     
     def is_quarantined(self, model: str) -> bool:
         """
         Check if a model is currently quarantined.
         
+        Once the cooldown expires the breaker half-opens: this caller is let
+        through as a single probe, and the model stays quarantined for everyone
+        else for another cooldown until the probe's outcome is recorded.
+        
         Args:
             model: The model to check
-            
+        
         Returns:
             True if model is quarantined
         """
-        return model in self.quarantined_models
+        until = self.quarantined_models.get(model)
+        if until is None:
+            return False
+        
+        now = time.monotonic()
+        if now < until:
+            return True
+        
+        self.quarantined_models[model] = now + self.circuit_breaker_cooldown
+        logger.info(f"Model {model} cooldown expired, allowing a probe request")
+        return False
     
     def get_available_model(self, primary_model: str) -> str:
         """
@@ -271,18 +487,26 @@ class MoERouter:
         
         Args:
             primary_model: The initially selected model
-            
+        
         Returns:
             An available (non-quarantined) model
         """
+        # Fast path: nothing is failing, which is the steady state
+        if not self.quarantined_models:
+            return primary_model
+        
         # Try primary first
         if not self.is_quarantined(primary_model):
             return primary_model
         
         logger.info(f"Primary model {primary_model} is quarantined, trying backups")
         
-        # Try backups in order
-        backups = self.get_backup_models(primary_model)
+        # Try the healthiest backups first; the stable sort keeps chain order
+        # among backups with equal failure counts (the common case)
+        backups = sorted(
+            self.get_backup_models(primary_model),
+            key=lambda model: self.failure_counts.get(model, 0),
+        )
         for backup in backups:
             if not self.is_quarantined(backup):
                 logger.info(f"Using backup model: {backup}")
@@ -298,49 +522,40 @@ class MoERouter:
         
         Args:
             messages: Original messages possibly containing images
-            
+        
         Returns:
             Messages with images removed, text content preserved
         """
-        cleaned_messages = []
-        
-        for msg in messages:
-            if isinstance(msg.get("content"), list):
-                # Multi-modal content - extract only text
-                text_parts = []
-                for item in msg["content"]:
-                    if isinstance(item, dict) and item.get("type") == "text":
-                        text_parts.append(item.get("text", ""))
-                
-                # Create text-only message
-                cleaned_msg = msg.copy()
-                cleaned_msg["content"] = " ".join(text_parts) if text_parts else ""
-                cleaned_messages.append(cleaned_msg)
-            else:
-                # Already text-only
-                cleaned_messages.append(msg)
+        if not any(isinstance(msg.get("content"), list) for msg in messages):
+            # Already text-only: nothing to copy
+            return messages
+        
+        # Only multi-modal messages are copied, with their text parts joined
+        cleaned_messages = [
+            {
+                **msg,
+                "content": " ".join(
+                    item.get("text", "")
+                    for item in msg["content"]
+                    if isinstance(item, dict) and item.get("type") == "text"
+                ),
+            }
+            if isinstance(msg.get("content"), list)
+            else msg
+            for msg in messages
+        ]
         
         logger.warning("Stripped images from messages for text-only fallback")
         return cleaned_messages
     
-    def get_all_expert_models(self) -> List[str]:
+    def get_all_expert_models(self) -> Tuple[str, ...]:
         """
-        Get list of all available expert models.
+        Get all available expert models.
         
         Returns:
-            List of all model names
+            Tuple of all model names (built once at startup)
         """
-        return [
-            self.reasoning_model,
-            self.fallback_model,
-            self.enterprise_model,
-            self.math_tool_model,
-            self.code_model,
-            self.aggregator_model,
-            self.cost_code_model,
-            self.vision_model,
-            self.vision_thinking_model,
-        ]
+        return self._all_expert_models
     
     async def select_experts_for_query(
         self, 
@@ -353,39 +568,43 @@ class MoERouter:
         Args:
             messages: The conversation messages
             k: Number of experts to select (uses config default if None)
-            
+        
         Returns:
             List of k expert model names
         """
         if k is None:
             k = settings.initial_expert_count
         
-        # Get primary expert based on routing
-        primary_expert, _ = await self.route_request(messages, use_rag=False)
+        # Get primary expert based on routing; features are extracted once and
+        # classified synchronously (memoized per message) without a coroutine hop
+        last_message, has_images = self._last_user_content(messages)
+        primary_expert, _ = self._route_with_features(last_message, has_images, use_rag=False)
         
         # Get available (non-quarantined) model
         primary_expert = self.get_available_model(primary_expert)
         
+        if k == 1:
+            # Single-expert fast path (the common interactive case)
+            logger.info(f"Selected 1 expert: {primary_expert}")
+            return [primary_expert]
+        
         experts = [primary_expert]
+        selected = {primary_expert}
         
         # Add backups and complementary experts
         if k > 1:
-            # Get backups for primary
-            backups = self.get_backup_models(primary_expert)
-            for backup in backups:
+            # Backups for the primary first, then other available models
+            candidates = itertools.chain(
+                self.get_backup_models(primary_expert),
+                self._all_expert_models,
+            )
+            for model in candidates:
                 if len(experts) >= k:
                     break
-                if not self.is_quarantined(backup) and backup not in experts:
-                    experts.append(backup)
-            
-            # Fill remaining slots with other available models
-            if len(experts) < k:
-                all_models = self.get_all_expert_models()
-                for model in all_models:
-                    if len(experts) >= k:
-                        break
-                    if not self.is_quarantined(model) and model not in experts:
-                        experts.append(model)
+                # Membership first, so duplicates never consume a half-open probe
+                if model not in selected and not self.is_quarantined(model):
+                    experts.append(model)
+                    selected.add(model)
         
         logger.info(f"Selected {len(experts)} experts: {experts}")
         return experts[:k]
@@ -396,7 +615,7 @@ class MoERouter:
         
         Args:
             responses: List of response texts from experts
-            
+        
         Returns:
             Score between 0-1 (higher = better coverage)
         """
@@ -405,40 +624,44 @@ class MoERouter:
         
         score = 1.0
         
-        # Check for low-confidence phrases
+        # Single pass: low-confidence phrases, total length and per-response word sets
         low_confidence_count = 0
+        total_length = 0
+        unique_words = set()
+        total_words = 0
+        check_diversity = len(responses) > 1
+        
         for response in responses:
             response_lower = response.lower()
-            for keyword in settings.confidence_keywords:
-                if keyword in response_lower:
-                    low_confidence_count += 1
-                    break
+            total_length += len(response)
+            
+            if self._confidence_matcher is not None and next(
+                self._confidence_matcher.iter(response_lower), None
+            ):
+                low_confidence_count += 1
+            
+            if check_diversity:
+                words = set(response_lower.split())
+                unique_words.update(words)
+                total_words += len(words)
         
         # Reduce score based on low-confidence responses
         confidence_penalty = (low_confidence_count / len(responses)) * 0.4
         score -= confidence_penalty
         
         # Check response length (very short responses indicate incompleteness)
-        avg_length = sum(len(r) for r in responses) / len(responses)
+        avg_length = total_length / len(responses)
         if avg_length < 50:
             score -= 0.3
         elif avg_length < 150:
             score -= 0.15
         
         # Check for response diversity (overlapping content)
-        if len(responses) > 1:
-            unique_words = set()
-            total_words = 0
-            for response in responses:
-                words = set(response.lower().split())
-                unique_words.update(words)
-                total_words += len(words)
-            
-            if total_words > 0:
-                diversity = len(unique_words) / total_words
-                # Low diversity means redundant responses
-                if diversity < 0.3:
-                    score -= 0.2
+        if check_diversity and total_words > 0:
+            diversity = len(unique_words) / total_words
+            # Low diversity means redundant responses
+            if diversity < 0.3:
+                score -= 0.2
         
         return max(0.0, min(1.0, score))
     
@@ -451,33 +674,12 @@ class MoERouter:
         
         Args:
             expert_responses: Dict mapping model names to their responses
-            
+        
         Returns:
             Aggregated response text
         """
-        if not expert_responses:
-            return ""
-        
-        if len(expert_responses) == 1:
-            return list(expert_responses.values())[0]
-        
-        # Simple aggregation: combine responses with attribution
-        aggregated = []
-        
-        for i, (model, response) in enumerate(expert_responses.items(), 1):
-            # Add response with minimal attribution
-            if len(expert_responses) > 2:
-                aggregated.append(f"{response}")
-            else:
-                aggregated.append(response)
-        
-        # If we have multiple responses, add a synthesis intro
-        if len(expert_responses) > 1:
-            result = "\n\n".join(aggregated)
-        else:
-            result = aggregated[0]
-        
-        return result
+        # Responses are combined verbatim, separated by blank lines
+        return "\n\n".join(expert_responses.values())
 
 
 # Global router instance
@@ -1,127 +1,202 @@
 #!/usr/bin/env python3
 """Example usage of the MoE Ollama Endpoint."""
 import asyncio
+import time
+from typing import List
 import httpx
 
+BASE_URL = "http://localhost:8000/v1"
+
+
+async def health_check(client: httpx.AsyncClient) -> List[str]:
+    """1. Health check."""
+    response = await client.get(f"{BASE_URL}/health")
+    return ["\n1. Health Check", f"   Status: {response.json()}"]
+
+
+async def list_models(client: httpx.AsyncClient) -> List[str]:
+    """2. List models."""
+    response = await client.get(f"{BASE_URL}/models")
+    models = response.json()
+    lines = ["\n2. List Available Models", f"   Found {len(models['data'])} models:"]
+    for model in models['data'][:5]:
+        lines.append(f"   - {model['id']}")
+    return lines
+
+
+async def simple_chat(client: httpx.AsyncClient) -> List[str]:
+    """3. Simple chat completion."""
+    response = await client.post(
+        f"{BASE_URL}/chat/completions",
+        json={
+            "model": "auto",
+            "messages": [
+                {"role": "user", "content": "What is Python?"}
+            ],
+            "temperature": 0.7,
+        }
+    )
+    result = response.json()
+    return [
+        "\n3. Simple Chat Completion (Auto-routing)",
+        f"   Model used: {result['model']}",
+        f"   Response: {result['choices'][0]['message']['content'][:100]}...",
+    ]
+
+
+async def code_chat(client: httpx.AsyncClient) -> List[str]:
+    """4. Code-specific query (should route to code model)."""
+    response = await client.post(
+        f"{BASE_URL}/chat/completions",
+        json={
+            "model": "auto",
+            "messages": [
+                {"role": "user", "content": "Write a Python function to calculate fibonacci numbers"}
+            ],
+        }
+    )
+    result = response.json()
+    return [
+        "\n4. Code Query (Should route to code model)",
+        f"   Model used: {result['model']}",
+        f"   Response: {result['choices'][0]['message']['content'][:150]}...",
+    ]
+
+
+async def embeddings(client: httpx.AsyncClient) -> List[str]:
+    """5. Generate embeddings."""
+    response = await client.post(
+        f"{BASE_URL}/embeddings",
+        json={
+            "model": "nomic-embed-text",
+            "input": "This is a test sentence for embeddings"
+        }
+    )
+    result = response.json()
+    embedding_dim = len(result['data'][0]['embedding'])
+    return [
+        "\n5. Generate Embeddings",
+        f"   Embedding dimension: {embedding_dim}",
+        f"   First 5 values: {result['data'][0]['embedding'][:5]}",
+    ]
+
+
+async def rag_ingest(client: httpx.AsyncClient) -> List[str]:
+    """6. RAG - Ingest documents."""
+    # Send documents in one request: the server embeds them in batched
+    # /api/embed calls instead of one embedding request per document
+    documents = [
+        {
+            "content": "The MoE Ollama Endpoint is a production-grade API that provides intelligent routing to multiple AI models.",
+            "metadata": {"source": "documentation", "version": "0.1.0"},
+            "collection": "docs"
+        },
+        {
+            "content": "FastAPI is a modern, fast web framework for building APIs with Python.",
+            "metadata": {"source": "tech", "topic": "web"},
+            "collection": "docs"
+        }
+    ]
+    documents += [
+        {
+            "content": f"Sample note {i}: batching many documents per ingest request amortizes embedding round-trips.",
+            "metadata": {"source": "example", "index": i},
+            "collection": "samples"
+        }
+        for i in range(62)
+    ]
+    start = time.perf_counter()
+    response = await client.post(
+        f"{BASE_URL}/rag/ingest",
+        json={"documents": documents}
+    )
+    # Ingestion runs in the background (202); poll the job until it finishes
+    job = response.json()
+    while job["status"] in ("pending", "running"):
+        await asyncio.sleep(0.5)
+        response = await client.get(f"{BASE_URL}/rag/jobs/{job['job_id']}")
+        job = response.json()
+    elapsed = time.perf_counter() - start
+    return [
+        "\n6. RAG - Ingest Documents",
+        f"   Job {job['job_id']}: {job['status']}",
+        f"   Ingested: {job['documents_ingested']} of {job['documents_total']} documents",
+        f"   Message: {job['message']}",
+        f"   Took {elapsed:.2f}s for {len(documents)} documents",
+    ]
+
+
+async def rag_search(client: httpx.AsyncClient) -> List[str]:
+    """7. RAG - Search documents."""
+    response = await client.get(
+        f"{BASE_URL}/rag/search",
+        params={"query": "What is the MoE endpoint?", "top_k": 2}
+    )
+    results = response.json()
+    lines = ["\n7. RAG - Search Documents", f"   Found {len(results['results'])} similar documents:"]
+    for i, doc in enumerate(results['results'], 1):
+        lines.append(f"   {i}. Similarity: {doc['similarity_score']:.3f}")
+        lines.append(f"      Content: {doc['content'][:80]}...")
+    return lines
+
+
+async def rag_chat(client: httpx.AsyncClient) -> List[str]:
+    """8. RAG-enabled chat."""
+    response = await client.post(
+        f"{BASE_URL}/chat/completions",
+        json={
+            "model": "auto",
+            "messages": [
+                {"role": "user", "content": "What is the MoE Ollama Endpoint?"}
+            ],
+            "use_rag": True,
+            "rag_collections": ["docs"]
+        }
+    )
+    result = response.json()
+    return [
+        "\n8. RAG-Enabled Chat Completion",
+        f"   Model used: {result['model']}",
+        f"   Response: {result['choices'][0]['message']['content'][:200]}...",
+    ]
+
+
+def print_steps(*steps: List[str]) -> None:
+    """Print step outputs in step order, regardless of completion order."""
+    for lines in steps:
+        print("\n".join(lines))
+
 
 async def main():
     """Demonstrate various API features."""
-    base_url = "http://localhost:8000/v1"
-    
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    # Reuse one pooled client for every call: keep-alive connections skip the
+    # TCP (and TLS) handshake per request. HTTP/2 is negotiated when the
+    # endpoint is served over TLS (e.g. behind a reverse proxy).
+    limits = httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=20,
+        keepalive_expiry=30.0,
+    )
+    async with httpx.AsyncClient(timeout=60.0, http2=True, limits=limits) as client:
         print("=" * 60)
         print("MoE Ollama Endpoint - Example Usage")
         print("=" * 60)
         
-        # 1. Health check
-        print("\n1. Health Check")
-        response = await client.get(f"{base_url}/health")
-        print(f"   Status: {response.json()}")
-        
-        # 2. List models
-        print("\n2. List Available Models")
-        response = await client.get(f"{base_url}/models")
-        models = response.json()
-        print(f"   Found {len(models['data'])} models:")
-        for model in models['data'][:5]:
-            print(f"   - {model['id']}")
-        
-        # 3. Simple chat completion
-        print("\n3. Simple Chat Completion (Auto-routing)")
-        response = await client.post(
-            f"{base_url}/chat/completions",
-            json={
-                "model": "auto",
-                "messages": [
-                    {"role": "user", "content": "What is Python?"}
-                ],
-                "temperature": 0.7,
-            }
-        )
-        result = response.json()
-        print(f"   Model used: {result['model']}")
-        print(f"   Response: {result['choices'][0]['message']['content'][:100]}...")
-        
-        # 4. Code-specific query (should route to code model)
-        print("\n4. Code Query (Should route to code model)")
-        response = await client.post(
-            f"{base_url}/chat/completions",
-            json={
-                "model": "auto",
-                "messages": [
-                    {"role": "user", "content": "Write a Python function to calculate fibonacci numbers"}
-                ],
-            }
-        )
-        result = response.json()
-        print(f"   Model used: {result['model']}")
-        print(f"   Response: {result['choices'][0]['message']['content'][:150]}...")
-        
-        # 5. Generate embeddings
-        print("\n5. Generate Embeddings")
-        response = await client.post(
-            f"{base_url}/embeddings",
-            json={
-                "model": "nomic-embed-text",
-                "input": "This is a test sentence for embeddings"
-            }
-        )
-        result = response.json()
-        embedding_dim = len(result['data'][0]['embedding'])
-        print(f"   Embedding dimension: {embedding_dim}")
-        print(f"   First 5 values: {result['data'][0]['embedding'][:5]}")
-        
-        # 6. RAG - Ingest documents
-        print("\n6. RAG - Ingest Documents")
-        response = await client.post(
-            f"{base_url}/rag/ingest",
-            json={
-                "documents": [
-                    {
-                        "content": "The MoE Ollama Endpoint is a production-grade API that provides intelligent routing to multiple AI models.",
-                        "metadata": {"source": "documentation", "version": "0.1.0"},
-                        "collection": "docs"
-                    },
-                    {
-                        "content": "FastAPI is a modern, fast web framework for building APIs with Python.",
-                        "metadata": {"source": "tech", "topic": "web"},
-                        "collection": "docs"
-                    }
-                ]
-            }
-        )
-        result = response.json()
-        print(f"   Ingested: {result['documents_ingested']} documents")
-        print(f"   Message: {result['message']}")
+        # Independent calls run concurrently; only ingest -> search/RAG chat is ordered
+        print_steps(*await asyncio.gather(
+            health_check(client),
+            list_models(client),
+            simple_chat(client),
+            code_chat(client),
+            embeddings(client),
+        ))
         
-        # 7. RAG - Search documents
-        print("\n7. RAG - Search Documents")
-        response = await client.get(
-            f"{base_url}/rag/search",
-            params={"query": "What is the MoE endpoint?", "top_k": 2}
-        )
-        results = response.json()
-        print(f"   Found {len(results['results'])} similar documents:")
-        for i, doc in enumerate(results['results'], 1):
-            print(f"   {i}. Similarity: {doc['similarity_score']:.3f}")
-            print(f"      Content: {doc['content'][:80]}...")
+        print_steps(await rag_ingest(client))
         
-        # 8. RAG-enabled chat
-        print("\n8. RAG-Enabled Chat Completion")
-        response = await client.post(
-            f"{base_url}/chat/completions",
-            json={
-                "model": "auto",
-                "messages": [
-                    {"role": "user", "content": "What is the MoE Ollama Endpoint?"}
-                ],
-                "use_rag": True,
-                "rag_collections": ["docs"]
-            }
-        )
-        result = response.json()
-        print(f"   Model used: {result['model']}")
-        print(f"   Response: {result['choices'][0]['message']['content'][:200]}...")
+        print_steps(*await asyncio.gather(
+            rag_search(client),
+            rag_chat(client),
+        ))
         
         print("\n" + "=" * 60)
         print("Example completed successfully!")
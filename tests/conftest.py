@@ -1,11 +1,29 @@
 """Configuration for pytest."""
+import httpx
 import pytest
-import asyncio
+import pytest_asyncio
+from app.main import app
 
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for the test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+class ManualClock:
+    """Hand-driven stand-in for the time module's monotonic clock."""
+    
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def client():
+    """Async client calling the app in-process, shared across the test session."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def manual_clock():
+    """Clock to monkeypatch over a module's ``time``; tests advance ``now`` by hand."""
+    return ManualClock()
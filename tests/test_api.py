@@ -1,38 +1,40 @@
 """Basic tests for the MoE Ollama Endpoint."""
 import pytest
-from fastapi.testclient import TestClient
-from app.main import app
+from cachetools import TTLCache
+from app.routes import rag as rag_routes
+from app.services.ollama_client import ollama_service
+from app.services.rag import rag_service
 
-client = TestClient(app)
+# Share the session-scoped client's event loop
+pytestmark = pytest.mark.asyncio(loop_scope="session")
 
 
-def test_health_check():
+async def test_health_check(client):
     """Test health check endpoint."""
-    response = client.get("/health")
+    response = await client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "healthy"}
 
 
-def test_root_endpoint():
+async def test_root_endpoint(client):
     """Test root endpoint."""
-    response = client.get("/")
+    response = await client.get("/")
     assert response.status_code == 200
     data = response.json()
     assert "name" in data
     assert data["name"] == "MoE Ollama Endpoint"
 
 
-def test_v1_health_check():
+async def test_v1_health_check(client):
     """Test v1 health check endpoint."""
-    response = client.get("/v1/health")
+    response = await client.get("/v1/health")
     assert response.status_code == 200
     assert response.json() == {"status": "healthy"}
 
 
-@pytest.mark.asyncio
-async def test_models_list():
+async def test_models_list(client):
     """Test models listing endpoint."""
-    response = client.get("/v1/models")
+    response = await client.get("/v1/models")
     assert response.status_code in [200, 500]  # May fail without Ollama connection
     if response.status_code == 200:
         data = response.json()
@@ -41,12 +43,43 @@ async def test_models_list():
         assert data["object"] == "list"
 
 
-@pytest.mark.asyncio
-async def test_chat_completion_structure():
+async def test_models_list_skips_non_string_entries(client, monkeypatch):
+    """Test the MoE config's backup_strategy mapping is not listed as a model."""
+    async def list_models():
+        return [{"name": "llama3:8b"}, {"name": "gpt-oss:20b-cloud"}]
+    monkeypatch.setattr(ollama_service, "list_models", list_models)
+    
+    response = await client.get("/v1/models")
+    assert response.status_code == 200
+    ids = [model["id"] for model in response.json()["data"]]
+    assert all(isinstance(model_id, str) for model_id in ids)
+    assert len(ids) == len(set(ids))
+    assert "llama3:8b" in ids
+    assert "gpt-oss:20b-cloud" in ids
+
+
+async def test_cors_preflight_allows_openai_sdk_headers(client):
+    """Test a browser preflight from an allowed origin accepts the OpenAI SDK's headers."""
+    requested = "authorization,content-type,x-stainless-os,openai-organization"
+    response = await client.options(
+        "/v1/chat/completions",
+        headers={
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "POST",
+            "Access-Control-Request-Headers": requested,
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+    allowed = response.headers["access-control-allow-headers"].lower()
+    assert all(header in allowed for header in requested.split(","))
+
+
+async def test_chat_completion_structure(client):
     """Test chat completion request structure."""
     # This will likely fail without actual Ollama connection
     # but tests the endpoint structure
-    response = client.post(
+    response = await client.post(
         "/v1/chat/completions",
         json={
             "model": "auto",
@@ -59,10 +92,9 @@ async def test_chat_completion_structure():
     assert response.status_code in [200, 500]
 
 
-@pytest.mark.asyncio
-async def test_embeddings_structure():
+async def test_embeddings_structure(client):
     """Test embeddings endpoint structure."""
-    response = client.post(
+    response = await client.post(
         "/v1/embeddings",
         json={
             "model": "nomic-embed-text",
@@ -71,3 +103,93 @@ async def test_embeddings_structure():
     )
     # Accept either success or service unavailable
     assert response.status_code in [200, 500]
+
+
+async def test_unknown_ingest_job(client):
+    """Test ingest job status for an unknown job id."""
+    response = await client.get("/v1/rag/jobs/unknown")
+    assert response.status_code == 404
+
+
+async def test_ingest_returns_pending_job(client, monkeypatch):
+    """Test ingest returns 202 with a pending job that then completes."""
+    async def ingest(documents, on_batch=None):
+        on_batch(len(documents))
+        return len(documents)
+    monkeypatch.setattr(rag_service, "ingest_documents", ingest)
+    
+    response = await client.post(
+        "/v1/rag/ingest", json={"documents": [{"content": "a"}, {"content": "b"}]}
+    )
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "pending"
+    assert job["documents_total"] == 2
+    assert job["documents_ingested"] == 0
+    
+    response = await client.get(f"/v1/rag/jobs/{job['job_id']}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert response.json()["documents_ingested"] == 2
+
+
+async def test_ingest_job_failure_keeps_committed_count(client, monkeypatch):
+    """Test a failed job reports the documents committed before the error."""
+    async def ingest(documents, on_batch=None):
+        on_batch(2)
+        raise RuntimeError("insert failed")
+    monkeypatch.setattr(rag_service, "ingest_documents", ingest)
+    
+    response = await client.post(
+        "/v1/rag/ingest", json={"documents": [{"content": str(i)} for i in range(5)]}
+    )
+    job_id = response.json()["job_id"]
+    
+    job = (await client.get(f"/v1/rag/jobs/{job_id}")).json()
+    assert job["status"] == "failed"
+    assert job["documents_ingested"] == 2
+    assert job["documents_total"] == 5
+
+
+async def test_ingest_wait_returns_result(client, monkeypatch):
+    """Test ingest with wait=true runs inline and returns 200."""
+    async def ingest(documents, on_batch=None):
+        return len(documents)
+    monkeypatch.setattr(rag_service, "ingest_documents", ingest)
+    
+    response = await client.post(
+        "/v1/rag/ingest", params={"wait": "true"}, json={"documents": [{"content": "a"}]}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "success": True,
+        "documents_ingested": 1,
+        "message": "Successfully ingested 1 documents",
+    }
+
+
+async def test_running_job_outlives_finished_job_cache(client, monkeypatch):
+    """Test a running job stays queryable however long it runs or many jobs finish."""
+    now = [0.0]
+    monkeypatch.setattr(rag_routes, "_finished_jobs", TTLCache(maxsize=2, ttl=50, timer=lambda: now[0]))
+    seen = []
+    
+    async def ingest(documents, on_batch=None):
+        # Outlive the TTL and churn more finished jobs through the cache than it holds
+        now[0] += 100
+        for i in range(3):
+            rag_routes._finished_jobs[f"other-{i}"] = None
+        job_id = next(iter(rag_routes._active_jobs))
+        seen.append((await client.get(f"/v1/rag/jobs/{job_id}")).json()["status"])
+        return len(documents)
+    monkeypatch.setattr(rag_service, "ingest_documents", ingest)
+    
+    response = await client.post("/v1/rag/ingest", json={"documents": [{"content": "a"}]})
+    job_id = response.json()["job_id"]
+    
+    assert seen == ["running"]
+    # The TTL counts from completion, so the finished job is still there
+    response = await client.get(f"/v1/rag/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert not rag_routes._active_jobs
@@ -0,0 +1,108 @@
+"""Tests for chat completion helpers."""
+from app.routes import chat
+
+
+class _FakeEncoding:
+    """Stand-in for a tiktoken encoding: one token per word."""
+    
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+class TestCompletionId:
+    """Test suite for completion id generation."""
+    
+    def test_completion_ids_random_and_well_formed(self):
+        """Test ids carry 96 random bits, so separate workers never share a sequence."""
+        ids = {chat._completion_id() for _ in range(1000)}
+        
+        assert len(ids) == 1000
+        assert all(id_.startswith("chatcmpl-") and len(id_) == len("chatcmpl-") + 24 for id_ in ids)
+
+
+class TestTokenCounting:
+    """Test suite for prompt and completion token counting."""
+    
+    def test_count_tokens_with_encoding(self, monkeypatch):
+        """Test tokens are counted with the BPE encoding when it is loaded."""
+        monkeypatch.setattr(chat, "load_token_encoding", lambda: _FakeEncoding())
+        assert chat._count_tokens("one two three") == 3
+    
+    def test_count_tokens_fallback_estimate(self, monkeypatch):
+        """Test the 4-characters-per-token estimate when no encoding is available."""
+        monkeypatch.setattr(chat, "load_token_encoding", lambda: None)
+        assert chat._count_tokens("a" * 40) == 10
+        assert chat._count_tokens("abc") == 0
+    
+    def test_count_message_tokens_text_parts_only(self, monkeypatch):
+        """Test prompt tokens count string content and text parts, not images."""
+        monkeypatch.setattr(chat, "load_token_encoding", lambda: _FakeEncoding())
+        messages = [
+            {"role": "system", "content": "be brief"},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "describe this"},
+                    {"type": "image_url", "image_url": {"url": "http://example.com/img.jpg"}},
+                    {"type": "text", "text": "in detail please"},
+                ],
+            },
+            {"role": "assistant", "content": None},
+        ]
+        assert chat._count_message_tokens(messages) == 2 + 2 + 3
+
+
+class TestMessageText:
+    """Test suite for reading and replacing message text."""
+    
+    def test_extract_text_str_content(self):
+        """Test string content is returned as-is."""
+        assert chat._extract_text("Hello") == "Hello"
+    
+    def test_extract_text_multimodal_content(self):
+        """Test text parts are joined and image parts ignored."""
+        content = [
+            {"type": "text", "text": "first"},
+            {"type": "image_url", "image_url": {"url": "http://example.com/a.jpg"}},
+            {"type": "text", "text": "second"},
+        ]
+        assert chat._extract_text(content) == "first\nsecond"
+    
+    def test_extract_text_non_text_content(self):
+        """Test missing, image-only and malformed content yield no text."""
+        assert chat._extract_text(None) == ""
+        assert chat._extract_text([{"type": "image_url", "image_url": {"url": "x"}}]) == ""
+        assert chat._extract_text(["not a part", 42]) == ""
+    
+    def test_replace_text_str_content(self):
+        """Test string content is replaced outright."""
+        message = {"role": "user", "content": "Hello"}
+        chat._replace_text(message, "Augmented")
+        assert message == {"role": "user", "content": "Augmented"}
+    
+    def test_replace_text_multimodal_content(self):
+        """Test text parts collapse into one at the first position, keeping images."""
+        image_a = {"type": "image_url", "image_url": {"url": "http://example.com/a.jpg"}}
+        image_b = {"type": "image_url", "image_url": {"url": "http://example.com/b.jpg"}}
+        message = {
+            "role": "user",
+            "content": [
+                image_a,
+                {"type": "text", "text": "first"},
+                image_b,
+                {"type": "text", "text": "second"},
+            ],
+        }
+        chat._replace_text(message, "Augmented")
+        assert message["content"] == [image_a, {"type": "text", "text": "Augmented"}, image_b]
+    
+    def test_replace_text_non_text_content(self):
+        """Test image-only content gains a text part and missing content becomes text."""
+        image = {"type": "image_url", "image_url": {"url": "http://example.com/a.jpg"}}
+        message = {"role": "user", "content": [image]}
+        chat._replace_text(message, "Augmented")
+        assert message["content"] == [{"type": "text", "text": "Augmented"}, image]
+        
+        message = {"role": "user"}
+        chat._replace_text(message, "Augmented")
+        assert message["content"] == "Augmented"
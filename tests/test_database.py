@@ -0,0 +1,53 @@
+"""Tests for database connection setup."""
+from app.db import database
+
+
+class _FakeAsyncpgConnection:
+    """Stand-in for an asyncpg connection recording executed statements."""
+    
+    def __init__(self):
+        self.executed = []
+    
+    def execute(self, query, *args):
+        self.executed.append((query, args))
+
+
+class _FakeDBAPIConnection:
+    """Stand-in for SQLAlchemy's adapted asyncpg connection."""
+    
+    def __init__(self):
+        self.driver_connection = _FakeAsyncpgConnection()
+    
+    def run_async(self, fn):
+        return fn(self.driver_connection)
+
+
+class TestIterativeScanSetting:
+    """Test suite for the version-gated hnsw.iterative_scan setting."""
+    
+    def test_parse_version(self):
+        """Test extension versions compare numerically."""
+        assert database._parse_version("0.8.0") >= (0, 8)
+        assert database._parse_version("0.10.1") >= (0, 8)
+        assert database._parse_version("0.5.1") < (0, 8)
+    
+    def test_set_on_connect_when_supported(self, monkeypatch):
+        """Test new connections enable iterative scans on pgvector >= 0.8."""
+        monkeypatch.setattr(database, "_iterative_scan_supported", True)
+        connection = _FakeDBAPIConnection()
+        
+        database._set_iterative_scan(connection, None)
+        
+        assert connection.driver_connection.executed == [(
+            "SELECT set_config('hnsw.iterative_scan', $1, false)",
+            (database.settings.hnsw_iterative_scan,),
+        )]
+    
+    def test_not_set_on_older_pgvector(self, monkeypatch):
+        """Test older pgvector connections never see the unknown setting."""
+        monkeypatch.setattr(database, "_iterative_scan_supported", False)
+        connection = _FakeDBAPIConnection()
+        
+        database._set_iterative_scan(connection, None)
+        
+        assert connection.driver_connection.executed == []
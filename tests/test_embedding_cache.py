@@ -0,0 +1,104 @@
+"""Tests for the single-flight embedding cache."""
+import asyncio
+import pytest
+from app.services.embedding_cache import EmbeddingCache
+from app.services.ollama_client import ollama_service
+
+
+class _FakeEmbedder:
+    """Stand-in for Ollama embeddings: records calls, optionally blocks or fails."""
+    
+    def __init__(self, gate=None, error=None):
+        self.calls = []
+        self.gate = gate
+        self.error = error
+    
+    async def generate_embeddings(self, model, text):
+        self.calls.append(list(text))
+        # Only the first call is gated, so retries by waiters run straight through
+        if self.gate is not None and len(self.calls) == 1:
+            await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return [[float(len(t)), 1.0] for t in text]
+
+
+async def _started(fake):
+    """Yield to the loop until the fake embedder has been called."""
+    while not fake.calls:
+        await asyncio.sleep(0)
+
+
+class TestEmbeddingCache:
+    """Test suite for embedding cache hits, misses and single-flight computation."""
+    
+    async def test_hit_and_miss(self, monkeypatch):
+        """Test misses are computed in one batch and later served from the cache."""
+        fake = _FakeEmbedder()
+        monkeypatch.setattr(ollama_service, "generate_embeddings", fake.generate_embeddings)
+        cache = EmbeddingCache()
+        
+        first = await cache.get_or_compute_many(["aa", "bbb", "aa"], "m")
+        second = await cache.get_or_compute_many(["bbb", "cccc"], "m")
+        
+        assert first == [[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]]
+        assert second == [[3.0, 1.0], [4.0, 1.0]]
+        # Duplicates share one input; cached texts are not sent again
+        assert fake.calls == [["aa", "bbb"], ["cccc"]]
+    
+    async def test_concurrent_misses_single_flight(self, monkeypatch):
+        """Test concurrent misses for the same text share one upstream call."""
+        gate = asyncio.Event()
+        fake = _FakeEmbedder(gate=gate)
+        monkeypatch.setattr(ollama_service, "generate_embeddings", fake.generate_embeddings)
+        cache = EmbeddingCache()
+        
+        owner = asyncio.create_task(cache.get_or_compute("hello", "m"))
+        await _started(fake)
+        waiter = asyncio.create_task(cache.get_or_compute("hello", "m"))
+        await asyncio.sleep(0)
+        gate.set()
+        
+        assert await owner == [5.0, 1.0]
+        assert await waiter == [5.0, 1.0]
+        assert fake.calls == [["hello"]]
+    
+    async def test_owner_failure_reaches_waiters(self, monkeypatch):
+        """Test an upstream error is raised to the owner and every waiter."""
+        gate = asyncio.Event()
+        fake = _FakeEmbedder(gate=gate, error=RuntimeError("ollama down"))
+        monkeypatch.setattr(ollama_service, "generate_embeddings", fake.generate_embeddings)
+        cache = EmbeddingCache()
+        
+        owner = asyncio.create_task(cache.get_or_compute("hello", "m"))
+        await _started(fake)
+        waiter = asyncio.create_task(cache.get_or_compute("hello", "m"))
+        await asyncio.sleep(0)
+        gate.set()
+        
+        with pytest.raises(RuntimeError, match="ollama down"):
+            await owner
+        with pytest.raises(RuntimeError, match="ollama down"):
+            await waiter
+        assert fake.calls == [["hello"]]
+    
+    async def test_owner_cancellation_waiter_recomputes(self, monkeypatch):
+        """Test a cancelled owner makes waiters compute the embedding, not get []."""
+        gate = asyncio.Event()
+        fake = _FakeEmbedder(gate=gate)
+        monkeypatch.setattr(ollama_service, "generate_embeddings", fake.generate_embeddings)
+        cache = EmbeddingCache()
+        
+        owner = asyncio.create_task(cache.get_or_compute("hello", "m"))
+        await _started(fake)
+        waiter = asyncio.create_task(cache.get_or_compute("hello", "m"))
+        await asyncio.sleep(0)
+        owner.cancel()
+        
+        assert await waiter == [5.0, 1.0]
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        assert fake.calls == [["hello"], ["hello"]]
+        # The recomputed embedding is cached for later callers
+        assert await cache.get_or_compute("hello", "m") == [5.0, 1.0]
+        assert len(fake.calls) == 2
@@ -0,0 +1,66 @@
+"""Tests for the queued JSON logging setup."""
+import atexit
+import logging
+from logging.handlers import QueueHandler
+import orjson
+import pytest
+from app.core.logging_config import setup_logging
+
+
+@pytest.fixture
+def root_logger():
+    """Root logger, with its handlers and level restored after the test."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+class TestSetupLogging:
+    """Test suite for routing log records through the queue as JSON lines."""
+    
+    def _emit(self, capsys, level, emit):
+        """Set up logging, emit records, flush the listener and return parsed lines."""
+        listener = setup_logging(level)
+        emit(logging.getLogger("app.test"))
+        # Stopping the listener drains the queue before returning
+        listener.stop()
+        atexit.unregister(listener.stop)
+        return [orjson.loads(line) for line in capsys.readouterr().err.splitlines()]
+    
+    def test_records_emitted_as_json_via_queue(self, root_logger, capsys):
+        """Test the root logger only queues records, and the listener writes JSON lines."""
+        records = self._emit(capsys, "INFO", lambda log: log.info("hello %s", "world"))
+        
+        assert [type(handler) for handler in root_logger.handlers] == [QueueHandler]
+        assert len(records) == 1
+        assert records[0]["level"] == "INFO"
+        assert records[0]["logger"] == "app.test"
+        assert records[0]["msg"] == "hello world"
+        assert records[0]["ts"]
+    
+    def test_level_filters_records(self, root_logger, capsys):
+        """Test records below the configured level are dropped."""
+        def emit(log):
+            log.info("dropped")
+            log.warning("kept")
+        
+        records = self._emit(capsys, "WARNING", emit)
+        
+        assert [record["msg"] for record in records] == ["kept"]
+    
+    def test_traceback_kept_on_one_line(self, root_logger, capsys):
+        """Test an exception's traceback is merged into the JSON message."""
+        def emit(log):
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                log.exception("failed")
+        
+        records = self._emit(capsys, "INFO", emit)
+        
+        assert len(records) == 1
+        assert records[0]["level"] == "ERROR"
+        assert records[0]["msg"].startswith("failed\nTraceback")
+        assert "ValueError: boom" in records[0]["msg"]
@@ -0,0 +1,205 @@
+"""Tests for the Ollama client: auth, stream parsing and the model list cache."""
+import asyncio
+import httpx
+import pytest
+from app.core.config import settings
+from app.services import ollama_client as ollama_module
+from app.services.ollama_client import OllamaService
+
+
+async def _chunks(*blocks):
+    """Yield raw byte blocks as a streaming body would."""
+    for block in blocks:
+        yield block
+
+
+async def _parse(*blocks):
+    """Collect every object parsed from the given byte blocks."""
+    return [chunk async for chunk in OllamaService._iter_stream_chunks(_chunks(*blocks))]
+
+
+class TestStreamParsing:
+    """Test suite for NDJSON stream splitting and parsing."""
+    
+    async def test_line_split_across_chunks(self):
+        """Test a line split over two byte blocks is parsed once complete."""
+        chunks = await _parse(b'{"message": {"con', b'tent": "Hi"}}\n')
+        assert chunks == [{"message": {"content": "Hi"}}]
+    
+    async def test_multiple_lines_in_one_chunk(self):
+        """Test several lines in one byte block are all parsed, in order."""
+        chunks = await _parse(b'{"n": 1}\n{"n": 2}\n{"n": 3}\n')
+        assert chunks == [{"n": 1}, {"n": 2}, {"n": 3}]
+    
+    async def test_trailing_line_without_newline(self):
+        """Test the last object is parsed even without a final newline."""
+        chunks = await _parse(b'{"n": 1}\n{"done": ', b'true}')
+        assert chunks == [{"n": 1}, {"done": True}]
+    
+    async def test_blank_lines_skipped(self):
+        """Test blank and whitespace-only lines yield nothing."""
+        chunks = await _parse(b'\n{"n": 1}\n\n  \r\n{"n": 2}\n\n')
+        assert chunks == [{"n": 1}, {"n": 2}]
+    
+    async def test_invalid_json_skipped(self):
+        """Test malformed lines are skipped without ending the stream."""
+        chunks = await _parse(b'{"n": 1}\nnot json\n{"n": \n{"n": 2}\n')
+        assert chunks == [{"n": 1}, {"n": 2}]
+    
+    async def test_stream_yields_before_body_completes(self):
+        """Test each chunk reaches the caller as soon as its line arrives."""
+        more_sent = asyncio.Event()
+        
+        async def body():
+            yield b'{"n": 1}\n'
+            # Only continue once the first chunk has been consumed
+            await more_sent.wait()
+            yield b'{"n": 2}\n'
+        
+        async def handler(request):
+            return httpx.Response(200, content=body())
+        
+        service = OllamaService()
+        service.client = httpx.AsyncClient(
+            transport=httpx.MockTransport(handler), base_url="http://ollama"
+        )
+        stream = service.generate_completion_stream("m", [{"role": "user", "content": "Hi"}])
+        
+        first = await asyncio.wait_for(stream.__anext__(), timeout=1.0)
+        more_sent.set()
+        rest = [chunk async for chunk in stream]
+        await service.close()
+        
+        assert first == {"n": 1}
+        assert rest == [{"n": 2}]
+
+
+class _TagsEndpoint:
+    """Stand-in for Ollama's /api/tags, returning a new model name on every call."""
+    
+    def __init__(self):
+        self.calls = []
+        # While set, requests fail as if Ollama were unreachable
+        self.down = False
+    
+    async def handler(self, request):
+        if self.down:
+            raise httpx.ConnectError("connection refused", request=request)
+        self.calls.append(request.url.path)
+        return httpx.Response(200, json={"models": [{"name": f"model-v{len(self.calls)}"}]})
+
+
+class TestModelListCache:
+    """Test suite for the TTL cache and refresh-ahead of the model list."""
+    
+    @pytest.fixture
+    def tags(self):
+        """Counting /api/tags stub."""
+        return _TagsEndpoint()
+    
+    @pytest.fixture
+    async def service(self, monkeypatch, manual_clock, tags):
+        """Ollama service over the tags stub, with a 30s TTL and a hand-driven clock."""
+        monkeypatch.setattr(ollama_module, "time", manual_clock)
+        monkeypatch.setattr(settings, "ollama_models_cache_ttl", 30.0)
+        service = OllamaService()
+        service.client = httpx.AsyncClient(
+            transport=httpx.MockTransport(tags.handler), base_url="http://ollama"
+        )
+        yield service
+        await service.close()
+    
+    async def test_served_from_cache_within_ttl(self, service, tags, manual_clock):
+        """Test no Ollama call is made while the cached list is fresh."""
+        first = await service.list_models()
+        
+        manual_clock.now = 1000.0 + 0.8 * 30.0 - 0.1
+        again = await asyncio.gather(*(service.list_models() for _ in range(10)))
+        
+        assert first == [{"name": "model-v1"}]
+        assert all(models == first for models in again)
+        assert tags.calls == ["/api/tags"]
+        assert service._models_refresh is None
+    
+    async def test_single_background_refresh_near_expiry(self, service, tags, manual_clock, monkeypatch):
+        """Test callers past 80% of the TTL get the cached list and share one refresh."""
+        await service.list_models()
+        scheduled = []
+        refresh = service._refresh_models_in_background
+        monkeypatch.setattr(
+            service, "_refresh_models_in_background", lambda: scheduled.append(1) or refresh()
+        )
+        
+        manual_clock.now = 1000.0 + 0.8 * 30.0
+        stale = await asyncio.gather(*(service.list_models() for _ in range(20)))
+        
+        # Every caller was answered from the cache before the refresh ran
+        assert all(models == [{"name": "model-v1"}] for models in stale)
+        assert len(scheduled) == 1
+        await service._models_refresh
+        assert len(tags.calls) == 2
+        assert await service.list_models() == [{"name": "model-v2"}]
+        assert len(tags.calls) == 2
+    
+    async def test_warmup_primes_cache(self, service, tags):
+        """Test warmup fetches the model list so the first caller is served from cache."""
+        await service.warmup()
+        
+        assert tags.calls == ["/api/tags"]
+        assert await service.list_models() == [{"name": "model-v1"}]
+        assert tags.calls == ["/api/tags"]
+    
+    async def test_warmup_swallows_failures(self, service, tags):
+        """Test an unreachable Ollama does not fail startup, and callers fetch later."""
+        tags.down = True
+        await service.warmup()
+        
+        assert service._models_cache is None
+        tags.down = False
+        assert await service.list_models() == [{"name": "model-v1"}]
+    
+    async def test_expired_list_fetched_once(self, service, tags, manual_clock):
+        """Test concurrent callers after expiry wait on a single fetch."""
+        await service.list_models()
+        
+        manual_clock.now = 1000.0 + 30.0
+        fresh = await asyncio.gather(*(service.list_models() for _ in range(10)))
+        
+        assert all(models == [{"name": "model-v2"}] for models in fresh)
+        assert len(tags.calls) == 2
+
+
+class TestAuth:
+    """Test suite for the bearer token on outgoing requests."""
+    
+    async def _sent_headers(self, monkeypatch, api_key):
+        """Headers of a completion request sent by a service built with the given key."""
+        sent = []
+        
+        async def handler(request):
+            sent.append(request.headers)
+            return httpx.Response(200, json={"message": {"content": "Hi"}})
+        
+        monkeypatch.setattr(settings, "ollama_api_key", api_key)
+        # Keep the service's own client (and its auth) but serve it from the stub
+        monkeypatch.setattr(
+            httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(handler)
+        )
+        service = OllamaService()
+        await service.generate_completion("m", [{"role": "user", "content": "Hi"}])
+        await service.generate_completion("m", [{"role": "user", "content": "Again"}])
+        await service.close()
+        return sent
+    
+    async def test_bearer_header_sent_with_key(self, monkeypatch):
+        """Test every request carries the bearer token when a key is configured."""
+        sent = await self._sent_headers(monkeypatch, "secret")
+        
+        assert [headers["authorization"] for headers in sent] == ["Bearer secret"] * 2
+    
+    async def test_no_auth_header_without_key(self, monkeypatch):
+        """Test no Authorization header is sent when no key is configured."""
+        sent = await self._sent_headers(monkeypatch, "")
+        
+        assert len(sent) == 2
+        assert all("authorization" not in headers for headers in sent)
@@ -0,0 +1,362 @@
+"""Tests for the RAG service: batched search, ingestion and prompt caching."""
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+from app.core.config import settings
+from app.db import database as database_module
+from app.services import rag as rag_module
+from app.services.rag import RAGService
+
+
+class _FakeEmbeddingCache:
+    """Embedding cache stub recording each batched call."""
+    
+    def __init__(self, empty=(), gate=None):
+        self.calls = []
+        self.empty = set(empty)
+        # When set, the first call blocks until the gate opens
+        self.gate = gate
+    
+    async def get_or_compute_many(self, texts, model):
+        self.calls.append(list(texts))
+        if self.gate is not None and len(self.calls) == 1:
+            await self.gate.wait()
+        return [[] if text in self.empty else [1.0, 0.0, 0.0] for text in texts]
+
+
+class _FakeDatabase:
+    """Database session stub returning canned rows and recording statements."""
+    
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.statements = []
+    
+    @asynccontextmanager
+    async def session(self):
+        yield self
+    
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return SimpleNamespace(all=lambda: list(self.rows))
+
+
+def _row(query_index, content, distance):
+    """Build a result row as the UNION ALL search returns it."""
+    return SimpleNamespace(
+        query_index=query_index,
+        content=content,
+        doc_metadata={"source": content},
+        collection="docs",
+        distance=distance,
+    )
+
+
+def _use_backends(monkeypatch, cache, database):
+    """Point the RAG service at the given embedding cache and database stubs."""
+    monkeypatch.setattr(rag_module, "embedding_cache", cache)
+    monkeypatch.setattr(rag_module, "get_db_session", database.session)
+
+
+@pytest.fixture
+def service():
+    """RAG service with a long batch window, so only early flushes finish quickly."""
+    service = RAGService()
+    service.batch_window = 10.0
+    service.batch_max_size = 64
+    return service
+
+
+class TestBatchedSearch:
+    """Test suite for micro-batched similarity search."""
+    
+    async def test_concurrent_searches_share_one_batch(self, service, monkeypatch):
+        """Test concurrent searches make one embedding call and one SQL execute."""
+        cache = _FakeEmbeddingCache()
+        database = _FakeDatabase([
+            _row(1, "b-far", -0.2),
+            _row(0, "a-far", -0.1),
+            _row(2, "c-near", -0.95),
+            _row(0, "a-near", -0.9),
+            _row(1, "b-near", -0.8),
+        ])
+        _use_backends(monkeypatch, cache, database)
+        
+        results = await asyncio.gather(
+            service.search_similar("a"),
+            service.search_similar("b"),
+            service.search_similar("c"),
+        )
+        
+        assert cache.calls == [["a", "b", "c"]]
+        assert len(database.statements) == 1
+        # Each caller gets only its own rows, most similar first
+        assert [doc["content"] for doc in results[0]] == ["a-near", "a-far"]
+        assert [doc["content"] for doc in results[1]] == ["b-near", "b-far"]
+        assert [doc["content"] for doc in results[2]] == ["c-near"]
+        assert results[0][0]["similarity_score"] == pytest.approx(0.9)
+    
+    async def test_fields_projected_per_request(self, service, monkeypatch):
+        """Test each caller only receives the fields it asked for."""
+        database = _FakeDatabase([_row(0, "a", -0.5), _row(1, "b", -0.5)])
+        _use_backends(monkeypatch, _FakeEmbeddingCache(), database)
+        
+        content_only, everything = await asyncio.gather(
+            service.search_similar("a", fields=("content",)),
+            service.search_similar("b"),
+        )
+        
+        assert content_only == [{"content": "a", "similarity_score": 0.5}]
+        assert everything == [{
+            "content": "b",
+            "metadata": {"source": "b"},
+            "collection": "docs",
+            "similarity_score": 0.5,
+        }]
+    
+    async def test_empty_embedding_skips_only_its_query(self, service, monkeypatch):
+        """Test a query without an embedding gets no results without sinking the batch."""
+        database = _FakeDatabase([_row(0, "a", -0.5), _row(2, "c", -0.5)])
+        _use_backends(monkeypatch, _FakeEmbeddingCache(empty={"bad"}), database)
+        
+        results = await asyncio.gather(
+            service.search_similar("a"),
+            service.search_similar("bad"),
+            service.search_similar("c"),
+        )
+        
+        assert [[doc["content"] for doc in docs] for docs in results] == [["a"], [], ["c"]]
+        # Only the two embedded queries became branches of the statement
+        sql = str(database.statements[0].compile(dialect=postgresql.dialect()))
+        assert sql.count("UNION ALL") == 1
+    
+    async def test_lone_search_not_delayed_by_window(self, service, monkeypatch):
+        """Test a search on an idle service does not wait out the batch window."""
+        _use_backends(monkeypatch, _FakeEmbeddingCache(), _FakeDatabase([_row(0, "a", -0.5)]))
+        
+        results = await asyncio.wait_for(service.search_similar("a"), timeout=1.0)
+        
+        assert [doc["content"] for doc in results] == ["a"]
+    
+    async def test_full_batch_flushes_early(self, service, monkeypatch):
+        """Test searches queued behind an in-flight batch flush once the batch is full."""
+        gate = asyncio.Event()
+        cache = _FakeEmbeddingCache(gate=gate)
+        _use_backends(monkeypatch, cache, _FakeDatabase())
+        service.batch_max_size = 2
+        
+        first = asyncio.create_task(service.search_similar("first"))
+        while not cache.calls:
+            await asyncio.sleep(0)
+        
+        # A batch is in flight, so these would wait the 10s window unless flushed when full
+        await asyncio.wait_for(
+            asyncio.gather(service.search_similar("a"), service.search_similar("b")),
+            timeout=1.0,
+        )
+        assert cache.calls[1] == ["a", "b"]
+        
+        gate.set()
+        await first
+    
+    async def test_cancelled_caller_does_not_break_batch(self, service, monkeypatch):
+        """Test cancelling one caller mid-batch still resolves the others."""
+        gate = asyncio.Event()
+        cache = _FakeEmbeddingCache(gate=gate)
+        database = _FakeDatabase([_row(0, "a", -0.5), _row(1, "b", -0.5), _row(2, "c", -0.5)])
+        _use_backends(monkeypatch, cache, database)
+        
+        tasks = [asyncio.create_task(service.search_similar(query)) for query in ("a", "b", "c")]
+        while not cache.calls:
+            await asyncio.sleep(0)
+        tasks[1].cancel()
+        gate.set()
+        
+        first, second, third = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        assert isinstance(second, asyncio.CancelledError)
+        assert [doc["content"] for doc in first] == ["a"]
+        assert [doc["content"] for doc in third] == ["c"]
+
+
+class _FakeIngestDatabase:
+    """Database stub committing inserted rows per session, failing on a chosen batch."""
+    
+    def __init__(self, fail_on_batch=None):
+        self.committed = []
+        self.batches = 0
+        self.fail_on_batch = fail_on_batch
+    
+    @asynccontextmanager
+    async def session(self):
+        pending = []
+        session = SimpleNamespace(execute=lambda stmt, rows: self._execute(pending, rows))
+        yield session
+        # Like get_db_session: commit only when the block exits cleanly
+        self.committed.extend(pending)
+    
+    async def _execute(self, pending, rows):
+        self.batches += 1
+        if self.batches == self.fail_on_batch:
+            raise RuntimeError("insert failed")
+        pending.extend(row["content"] for row in rows)
+
+
+class _FailingEmbeddingCache(_FakeEmbeddingCache):
+    """Embedding cache stub that fails on a chosen call."""
+    
+    def __init__(self, fail_on_call):
+        super().__init__()
+        self.fail_on_call = fail_on_call
+    
+    async def get_or_compute_many(self, texts, model):
+        if len(self.calls) + 1 == self.fail_on_call:
+            self.calls.append(list(texts))
+            raise RuntimeError("embedding failed")
+        return await super().get_or_compute_many(texts, model)
+
+
+class TestIngestPipeline:
+    """Test suite for batched ingestion and its failure modes."""
+    
+    @pytest.fixture
+    def documents(self):
+        """Five documents, ingested in batches of two."""
+        return [{"content": f"doc {i}", "collection": "docs"} for i in range(5)]
+    
+    async def test_ingest_commits_every_batch(self, service, monkeypatch, documents):
+        """Test all batches are embedded and committed."""
+        cache, database = _FakeEmbeddingCache(), _FakeIngestDatabase()
+        _use_backends(monkeypatch, cache, database)
+        service.ingest_batch_size = 2
+        
+        assert await service.ingest_documents(documents) == 5
+        assert database.committed == [doc["content"] for doc in documents]
+        assert len(cache.calls) == 3
+    
+    async def test_embedding_error_keeps_earlier_batches(self, service, monkeypatch, documents):
+        """Test an embedding failure stops ingestion after the batches before it commit."""
+        cache, database = _FailingEmbeddingCache(fail_on_call=2), _FakeIngestDatabase()
+        _use_backends(monkeypatch, cache, database)
+        service.ingest_batch_size = 2
+        
+        with pytest.raises(RuntimeError, match="embedding failed"):
+            await service.ingest_documents(documents)
+        
+        assert database.committed == ["doc 0", "doc 1"]
+        # The batch after the failure is never embedded
+        assert len(cache.calls) == 2
+    
+    async def test_database_error_keeps_earlier_batches(self, service, monkeypatch, documents):
+        """Test an insert failure rolls back its batch and skips the remaining ones."""
+        database = _FakeIngestDatabase(fail_on_batch=2)
+        _use_backends(monkeypatch, _FakeEmbeddingCache(), database)
+        service.ingest_batch_size = 2
+        
+        with pytest.raises(RuntimeError, match="insert failed"):
+            await service.ingest_documents(documents)
+        
+        assert database.committed == ["doc 0", "doc 1"]
+        assert database.batches == 2
+
+
+class TestPromptCache:
+    """Test suite for the per-process augmented prompt cache."""
+    
+    @pytest.fixture
+    def searches(self):
+        """Queries seen by the stubbed similarity search."""
+        return []
+    
+    def _service(self, monkeypatch, searches, ttl):
+        """RAG service built with the given prompt cache TTL and a recording search stub."""
+        async def search_similar(query, collection=None, fields=None):
+            searches.append(query)
+            return [{"content": f"context {len(searches)}"}]
+        
+        monkeypatch.setattr(settings, "rag_prompt_cache_ttl", ttl)
+        service = RAGService()
+        monkeypatch.setattr(service, "search_similar", search_similar)
+        return service
+    
+    async def test_disabled_with_zero_ttl(self, monkeypatch, searches):
+        """Test every query searches again when the cache is off (the default)."""
+        service = self._service(monkeypatch, searches, 0)
+        
+        first = await service.augment_prompt("q")
+        second = await service.augment_prompt("q")
+        
+        assert searches == ["q", "q"]
+        assert "context 1" in first and "context 2" in second
+    
+    async def test_reused_until_local_ingest(self, monkeypatch, searches):
+        """Test a cached prompt is reused until this process ingests documents."""
+        _use_backends(monkeypatch, _FakeEmbeddingCache(), _FakeIngestDatabase())
+        service = self._service(monkeypatch, searches, 60.0)
+        
+        first = await service.augment_prompt("q")
+        assert await service.augment_prompt("q") == first
+        assert searches == ["q"]
+        
+        await service.ingest_documents([{"content": "new"}])
+        assert "context 2" in await service.augment_prompt("q")
+        assert searches == ["q", "q"]
+
+
+class _RecordingEngine:
+    """Async engine stub recording the DDL init_db runs on a pgvector 0.8 database."""
+    
+    def __init__(self):
+        self.statements = []
+    
+    @asynccontextmanager
+    async def begin(self):
+        yield self
+    
+    async def execute(self, clause, params=None):
+        self.statements.append(str(clause))
+    
+    async def scalar(self, clause):
+        return "0.8.0"
+    
+    async def run_sync(self, fn):
+        pass
+
+
+class TestBinaryQuantization:
+    """Test suite for the Hamming prefilter and its supporting index."""
+    
+    async def test_prefilter_matches_index_expression(self, monkeypatch):
+        """Test the prefilter orders by the expression the sign-bit index is built on."""
+        dimension = settings.vector_dimension
+        monkeypatch.setattr(settings, "rag_binary_quantization", True)
+        monkeypatch.setattr(database_module, "_iterative_scan_supported", False)
+        engine = _RecordingEngine()
+        monkeypatch.setattr(database_module, "async_engine", engine)
+        await database_module.init_db()
+        
+        ddl = next(sql for sql in engine.statements if "bit_hamming_ops" in sql)
+        index_expression = re.search(r"USING hnsw \(\((.+)\) bit_hamming_ops\)", ddl).group(1)
+        assert index_expression == f"binary_quantize(embedding)::bit({dimension})"
+        
+        service = RAGService()
+        service.rerank_factor = 10
+        query_vector = np.full(dimension, dimension ** -0.5, dtype=np.float32)
+        stmt = service._search_branch(0, query_vector, "docs", 5, ["content"])
+        compiled = stmt.compile(dialect=postgresql.dialect())
+        sql = " ".join(str(compiled).split())
+        
+        # CAST(x AS BIT(n)) is the same expression as x::bit(n), so the planner can use the index
+        assert (
+            f"ORDER BY CAST(binary_quantize(documents.embedding) AS BIT({dimension})) <~> "
+            f"binary_quantize(CAST(%(param_2)s AS HALFVEC({dimension})))"
+        ) in sql
+        # Candidates are reranked by exact inner product over the outer query
+        assert sql.endswith(
+            "ORDER BY anon_1.embedding <#> %(embedding_1)s LIMIT %(param_4)s::INTEGER"
+        )
+        assert compiled.params["param_3"] == 5 * 10
+        assert compiled.params["param_4"] == 5
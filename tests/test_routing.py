@@ -1,123 +1,125 @@
 """Tests for the MoE routing logic with Ollama Cloud models."""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import httpx
 import pytest
-from app.services.router import moe_router
+from app.services import router as router_module
+from app.services.ollama_client import ollama_service
+from app.services.router import OllamaLM, moe_router
 
 
-class TestMoERouting:
-    """Test suite for MoE routing decisions."""
-
-    @pytest.mark.asyncio
-    async def test_vision_routing_simple(self):
-        """Test routing to vision model for simple image tasks."""
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "What's in this image?"},
-                    {"type": "image_url", "image_url": {"url": "https://example.com/img.jpg"}}
-                ]
-            }
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "qwen3-vl:235b-cloud"
-        assert use_rag is False
-
-    @pytest.mark.asyncio
-    async def test_vision_routing_with_reasoning(self):
-        """Test routing to vision+thinking model for complex visual reasoning."""
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Analyze this image in detail and explain the reasoning"},
-                    {"type": "image_url", "image_url": {"url": "https://example.com/img.jpg"}}
-                ]
-            }
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "qwen3-vl:235b-instruct-cloud"
-        assert use_rag is False
-
-    @pytest.mark.asyncio
-    async def test_code_routing_advanced(self):
-        """Test routing to advanced code model."""
-        messages = [
-            {"role": "user", "content": "Write a complex function to implement a binary search tree"}
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "qwen3-coder:480b-cloud"
-        assert use_rag is False
-
-    @pytest.mark.asyncio
-    async def test_code_routing_simple(self):
-        """Test routing to cost-effective code model for simple tasks."""
-        messages = [
-            {"role": "user", "content": "Write a simple script to print hello world"}
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "minimax-m2:cloud"
-        assert use_rag is False
-
-    @pytest.mark.asyncio
-    async def test_math_tool_routing(self):
-        """Test routing to math/tool model."""
-        messages = [
-            {"role": "user", "content": "Calculate the integral of x^2 from 0 to 10"}
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "kimi-k2:1t-cloud"
-        assert use_rag is False
+_IMAGE_PART = {"type": "image_url", "image_url": {"url": "https://example.com/img.jpg"}}
 
-    @pytest.mark.asyncio
-    async def test_reasoning_routing(self):
-        """Test routing to complex reasoning model."""
-        messages = [
-            {"role": "user", "content": "Analyze the complex implications of quantum computing on cryptography"}
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "deepseek-v3.1:671b-cloud"
-        assert use_rag is False
+# (case, messages, expected model, expected use_rag)
+ROUTING_CASES = [
+    (
+        "vision simple",
+        [{"role": "user", "content": [{"type": "text", "text": "What's in this image?"}, _IMAGE_PART]}],
+        "qwen3-vl:235b-cloud",
+        False,
+    ),
+    (
+        "vision with reasoning",
+        [{"role": "user", "content": [
+            {"type": "text", "text": "Analyze this image in detail and explain the reasoning"},
+            _IMAGE_PART,
+        ]}],
+        "qwen3-vl:235b-instruct-cloud",
+        False,
+    ),
+    (
+        "advanced code",
+        [{"role": "user", "content": "Write a complex function to implement a binary search tree"}],
+        "qwen3-coder:480b-cloud",
+        False,
+    ),
+    (
+        "simple code",
+        [{"role": "user", "content": "Write a simple script to print hello world"}],
+        "minimax-m2:cloud",
+        False,
+    ),
+    (
+        "math/tool",
+        [{"role": "user", "content": "Calculate the integral of x^2 from 0 to 10"}],
+        "kimi-k2:1t-cloud",
+        False,
+    ),
+    (
+        "reasoning",
+        [{"role": "user", "content": "Analyze the complex implications of quantum computing on cryptography"}],
+        "deepseek-v3.1:671b-cloud",
+        False,
+    ),
+    (
+        "enterprise",
+        [{"role": "user", "content": "Provide an enterprise production analysis of market trends"}],
+        "gpt-oss:120b-cloud",
+        False,
+    ),
+    (
+        "aggregation",
+        [{"role": "user", "content": "Summarize and combine these multiple reports"}],
+        "glm-4.6:cloud",
+        False,
+    ),
+    (
+        "rag",
+        [{"role": "user", "content": "Search the knowledge base for information about AI"}],
+        "gpt-oss:20b-cloud",
+        True,
+    ),
+    (
+        "default",
+        [{"role": "user", "content": "Hello, how are you?"}],
+        "gpt-oss:20b-cloud",
+        False,
+    ),
+]
 
-    @pytest.mark.asyncio
-    async def test_enterprise_routing(self):
-        """Test routing to enterprise model."""
-        messages = [
-            {"role": "user", "content": "Provide an enterprise production analysis of market trends"}
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "gpt-oss:120b-cloud"
-        assert use_rag is False
 
-    @pytest.mark.asyncio
-    async def test_aggregation_routing(self):
-        """Test routing to aggregator model."""
-        messages = [
-            {"role": "user", "content": "Summarize and combine these multiple reports"}
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "glm-4.6:cloud"
-        assert use_rag is False
+@pytest.fixture(autouse=True)
+def reset_circuit_breaker():
+    """Clear shared circuit-breaker state so tests don't depend on order."""
+    moe_router.failure_counts.clear()
+    moe_router.quarantined_models.clear()
+    yield
+    moe_router.failure_counts.clear()
+    moe_router.quarantined_models.clear()
 
-    @pytest.mark.asyncio
-    async def test_rag_routing(self):
-        """Test routing with RAG enabled."""
-        messages = [
-            {"role": "user", "content": "Search the knowledge base for information about AI"}
-        ]
-        model, use_rag = await moe_router.route_request(messages)
-        assert model == "gpt-oss:20b-cloud"
-        assert use_rag is True
 
-    @pytest.mark.asyncio
-    async def test_default_routing(self):
-        """Test default fallback routing."""
-        messages = [
-            {"role": "user", "content": "Hello, how are you?"}
-        ]
+class TestMoERouting:
+    """Test suite for MoE routing decisions."""
+    
+    @pytest.mark.parametrize(
+        "messages,expected_model,expected_rag",
+        [case[1:] for case in ROUTING_CASES],
+        ids=[case[0] for case in ROUTING_CASES],
+    )
+    async def test_routing_matrix(self, messages, expected_model, expected_rag):
+        """Test the routing decision for each expert."""
         model, use_rag = await moe_router.route_request(messages)
-        assert model == "gpt-oss:20b-cloud"
-        assert use_rag is False
-
+        
+        assert model == expected_model
+        assert use_rag is expected_rag
+    
+    async def test_route_cache_keyed_by_digest(self, monkeypatch):
+        """Test repeated messages hit the route cache without it holding the text."""
+        calls = []
+        classify = moe_router._classify_uncached
+        monkeypatch.setattr(
+            moe_router, "_classify_uncached", lambda *args: calls.append(args) or classify(*args)
+        )
+        prompt = "Calculate the integral of x^2 " + "z" * 100_000
+        messages = [{"role": "user", "content": prompt}]
+        
+        first = await moe_router.route_request(messages)
+        second = await moe_router.route_request(messages)
+        
+        assert first == second == ("kimi-k2:1t-cloud", False)
+        assert len(calls) == 1
+        assert all(len(digest) == 16 for digest, _ in moe_router._route_cache)
+    
     def test_backup_chain(self):
         """Test backup chain configuration."""
         # Test reasoning model backup
@@ -135,7 +137,7 @@ class TestMoERouting:
         # Test fallback model backup
         backups = moe_router.get_backup_models("gpt-oss:20b-cloud")
         assert backups == ["gpt-oss:120b-cloud"]
-
+    
     def test_model_info(self):
         """Test model info retrieval."""
         info = moe_router.get_model_info()
@@ -234,7 +236,6 @@ class TestMoERouting:
         assert "qwen3-coder:480b-cloud" in all_models
         assert "qwen3-vl:235b-cloud" in all_models
     
-    @pytest.mark.asyncio
     async def test_select_experts_for_query(self):
         """Test expert selection for a query."""
         messages = [{"role": "user", "content": "Write a Python function"}]
@@ -245,7 +246,6 @@ class TestMoERouting:
         # Should get 2 valid models (routing may vary)
         assert all(expert in moe_router.get_all_expert_models() for expert in experts)
     
-    @pytest.mark.asyncio
     async def test_select_experts_expansion(self):
         """Test expert selection with k expansion."""
         messages = [{"role": "user", "content": "Explain quantum computing"}]
@@ -303,3 +303,187 @@ class TestMoERouting:
         
         aggregated = moe_router.aggregate_expert_responses(expert_responses)
         assert aggregated == "Here's the code implementation."
+
+
+class TestCircuitBreaker:
+    """Test suite for circuit-breaker quarantine, probing and backoff."""
+    
+    MODEL = "deepseek-v3.1:671b-cloud"
+    
+    @pytest.fixture
+    def clock(self, monkeypatch, manual_clock):
+        """The router's monotonic clock, driven by hand from 1000.0."""
+        monkeypatch.setattr(router_module, "time", manual_clock)
+        return manual_clock
+    
+    def _trip(self):
+        """Record enough failures to quarantine the model."""
+        for _ in range(moe_router.circuit_breaker_threshold):
+            moe_router.record_failure(self.MODEL)
+    
+    def test_quarantined_until_cooldown_expires(self, clock):
+        """Test the model stays quarantined for the whole cooldown."""
+        self._trip()
+        
+        clock.now = 1000.0 + moe_router.circuit_breaker_cooldown - 0.1
+        assert moe_router.is_quarantined(self.MODEL)
+        assert moe_router.is_quarantined(self.MODEL)
+    
+    def test_single_probe_after_expiry(self, clock):
+        """Test exactly one caller is let through once the cooldown expires."""
+        self._trip()
+        
+        clock.now = 1000.0 + moe_router.circuit_breaker_cooldown
+        probes = [moe_router.is_quarantined(self.MODEL) for _ in range(5)]
+        
+        assert probes == [False, True, True, True, True]
+    
+    def test_failed_probe_lengthens_cooldown(self, clock):
+        """Test a failed probe re-quarantines the model for a longer cooldown."""
+        cooldown = moe_router.circuit_breaker_cooldown
+        self._trip()
+        probe_at = 1000.0 + cooldown
+        clock.now = probe_at
+        assert not moe_router.is_quarantined(self.MODEL)
+        
+        moe_router.record_failure(self.MODEL)
+        longer = cooldown * moe_router.retry_backoff_factor
+        
+        clock.now = probe_at + longer - 0.1
+        assert moe_router.is_quarantined(self.MODEL)
+        clock.now = probe_at + longer
+        assert not moe_router.is_quarantined(self.MODEL)
+    
+    def test_cooldown_capped(self, clock):
+        """Test repeated failed probes never push the cooldown past the cap."""
+        for _ in range(100):
+            moe_router.record_failure(self.MODEL)
+        
+        max_cooldown = moe_router.circuit_breaker_max_cooldown
+        assert moe_router.quarantined_models[self.MODEL] == 1000.0 + max_cooldown
+        clock.now = 1000.0 + max_cooldown - 0.1
+        assert moe_router.is_quarantined(self.MODEL)
+        clock.now = 1000.0 + max_cooldown
+        assert not moe_router.is_quarantined(self.MODEL)
+    
+    def test_success_clears_quarantine(self, clock):
+        """Test a successful probe ends the quarantine and resets the failure count."""
+        self._trip()
+        clock.now = 1000.0 + moe_router.circuit_breaker_cooldown
+        assert not moe_router.is_quarantined(self.MODEL)
+        
+        moe_router.record_success(self.MODEL)
+        
+        assert not moe_router.is_quarantined(self.MODEL)
+        assert self.MODEL not in moe_router.failure_counts
+        # A single new failure does not re-quarantine a recovered model
+        moe_router.record_failure(self.MODEL)
+        assert not moe_router.is_quarantined(self.MODEL)
+
+
+class TestKeywordScan:
+    """Test suite for windowed keyword matching over long prompts."""
+    
+    WINDOW = moe_router.SCAN_WINDOW
+    
+    def _full_scan(self, text):
+        """Reference result: every category matched in one pass over the whole text."""
+        matches = moe_router._classifier.iter(text.lower())
+        return frozenset().union(*(categories for _, categories in matches))
+    
+    def _text_with(self, keyword, start, length=3 * 8192):
+        """Filler text with the keyword placed at the given offset."""
+        return "x" * start + keyword + "x" * (length - start - len(keyword))
+    
+    @pytest.mark.parametrize(
+        "offset", [-1, -4, -8], ids=["one-char-before", "mid", "mostly-before"]
+    )
+    def test_keyword_straddling_window_boundary(self, offset):
+        """Test a keyword split across two windows is still found."""
+        text = self._text_with("CALCULATE", self.WINDOW + offset)
+        
+        assert moe_router._match_categories(text) == frozenset({"math_tool"})
+    
+    def test_longest_keyword_straddling_boundary(self):
+        """Test the longest keyword with one character in the first window is found."""
+        keyword = max(moe_router._classifier.keys(), key=len)
+        assert len(keyword) - 1 == moe_router._scan_overlap
+        text = self._text_with(keyword, self.WINDOW - 1)
+        
+        assert moe_router._match_categories(text) == self._full_scan(text) != frozenset()
+    
+    @pytest.mark.parametrize("offset", [0, 2, 7], ids=["at-boundary", "inside", "overlap-end"])
+    def test_keyword_inside_overlap_region(self, offset):
+        """Test a keyword scanned by both adjacent windows is reported once."""
+        keyword = "summarize"
+        text = self._text_with(keyword, self.WINDOW + offset)
+        # Both windows see the whole keyword
+        assert self.WINDOW + offset + len(keyword) <= self.WINDOW + moe_router._scan_overlap
+        
+        hits = [
+            categories
+            for start in range(0, len(text), self.WINDOW)
+            for _, categories in moe_router._classifier.iter(
+                text[start:start + self.WINDOW + moe_router._scan_overlap].lower()
+            )
+        ]
+        assert len(hits) == 2
+        assert moe_router._match_categories(text) == frozenset({"aggregation"})
+    
+    def test_windowed_scan_matches_full_scan(self, monkeypatch):
+        """Test small windows give the full-scan result for every keyword placement."""
+        monkeypatch.setattr(moe_router, "SCAN_WINDOW", 8)
+        for keyword in ("why", "api", "calculate", "explain in depth", "detailed analysis"):
+            for start in range(40):
+                text = self._text_with(keyword, start, length=64)
+                assert moe_router._match_categories(text) == self._full_scan(text), (keyword, start)
+
+
+class TestOllamaLM:
+    """Test suite for the DSPy Ollama wrapper's sync and async entry points."""
+    
+    def test_sync_calls_use_background_loop_client(self, monkeypatch):
+        """Test sync calls run on the background loop's own client, never the app's."""
+        async def app_client_used(**kwargs):
+            raise AssertionError("sync call reached the app loop's client")
+        monkeypatch.setattr(ollama_service, "generate_completion", app_client_used)
+        
+        threads = []
+        
+        async def handler(request):
+            threads.append(threading.current_thread().name)
+            return httpx.Response(200, json={"message": {"content": "pong"}})
+        
+        _, service = router_module._get_sync_runtime()
+        monkeypatch.setattr(
+            service, "client",
+            httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://ollama"),
+        )
+        lm = OllamaLM("gpt-oss:20b-cloud")
+        
+        # Concurrent sync callers from several threads share the one loop
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lm, ["ping"] * 8))
+        
+        assert results == ["pong"] * 8
+        assert threads == ["ollama-lm-sync-loop"] * 8
+    
+    async def test_sync_call_inside_event_loop_raises(self):
+        """Test a sync call from async code fails instead of blocking the loop."""
+        with pytest.raises(RuntimeError, match="use acall"):
+            OllamaLM("gpt-oss:20b-cloud")("ping")
+    
+    async def test_acall_uses_app_client(self, monkeypatch):
+        """Test async calls go through the shared app-loop Ollama service."""
+        calls = []
+        
+        async def generate_completion(**kwargs):
+            calls.append(kwargs)
+            return {"message": {"content": "pong"}}
+        monkeypatch.setattr(ollama_service, "generate_completion", generate_completion)
+        
+        messages = [{"role": "user", "content": "ping"}]
+        content = await OllamaLM("gpt-oss:20b-cloud").acall(messages)
+        
+        assert content == "pong"
+        assert calls == [{"model": "gpt-oss:20b-cloud", "messages": messages}]